@@ -45,13 +45,13 @@ Original file is located at
 
 import datetime  # for time data manipulation
 import os
+from glob import glob
 
-import numpy as np  # for array manipulation
 import pandas as pd  # for data querying and processing
 import requests  # useful for sending HTTP requests
-from bs4 import BeautifulSoup  # reads data from website (web scraping)
 
 import thaao_settings as ts
+import tools as tls
 
 """**Setup input parameters such as date, data level, averaging type, AOD range for mapping, AOD/Angstrom exponent, and geographical limits**"""
 
@@ -67,17 +67,81 @@ average_type = 1  # daily (1), monthly (2)
 feature_choice = 1  # Enter '1' if you are specifying an AOD wavelength or '2' if you are specifying an Angstrom exponent
 wavelength = 500  # Available choices: 1640, 1020, 870, 865, 779, 675, 667, 620, 560, 555, 551, 532, 531, 510, 500, 490, 443, 440, 412, 400, 380, 340
 Angstrom_exp = '440-675'  # Available choices: '440-870','380-500','440-675','500-870','340-440','440-675(Polar)'
+raw_folder = os.path.join(folder, 'raw')  # raw responses of the web service, one file per year
+
+
+def aeronet_url(start, end, aod_level):
+    """
+    :param start: first day requested
+    :param end: last day requested
+    :param aod_level: 10, 15 or 20
+    :return: url of the AERONET web service (plain text output) for the site between start and end
+    """
+    return ('https://aeronet.gsfc.nasa.gov/cgi-bin/print_web_data_v3?site=' + site + start.strftime(
+            '&year=%Y&month=%m&day=%d') + end.strftime('&year2=%Y&month2=%m&day2=%d') + '&AOD' + str(
+            aod_level) + '=1&AVG=20&if_no_html=1')
+
+
+def year_file(year, aod_level):
+    """
+    :param year: year
+    :param aod_level: 10, 15 or 20
+    :return: path of the cached response for the year
+    """
+    return os.path.join(raw_folder, f'aeronet_{site}_L{aod_level}_{year}.csv')
+
+
+def fetch_raw(year, end, aod_level):
+    """
+    Downloads the data of one year (up to end, for the open one), streaming the response straight into the local
+    cache of raw responses, where it replaces the previous download of the year.
+    :param year: year requested
+    :param end: last day of the instrument
+    :param aod_level: 10, 15 or 20
+    :return: path of the cached response
+    """
+    os.makedirs(raw_folder, exist_ok=True)
+    fn = year_file(year, aod_level)
+    start = datetime.datetime(year, 1, 1)
+    end = min(datetime.datetime(year, 12, 31), end)
+    with requests.get(aeronet_url(start, end, aod_level), stream=True, timeout=600) as resp:
+        resp.raise_for_status()
+        with open(fn + '.part', 'wb') as f:
+            for chunk in resp.iter_content(chunk_size=1 << 16):
+                f.write(chunk)
+    os.replace(fn + '.part', fn)  # incomplete downloads never end up in the cache
+    return fn
+
+
+def read_raw(fn):
+    """
+    Reads the days with data from a raw response, parsing only the date column with an explicit format.
+    :param fn: path of the cached response
+    :return: DatetimeIndex of the days with data
+    """
+    with open(fn, 'r', errors='replace') as f:
+        for n_head, line in enumerate(f):
+            if 'Date(dd:mm:yyyy)' in line:
+                break
+        else:
+            return pd.DatetimeIndex([])  # no data in the response
+    data = pd.read_csv(fn, skiprows=n_head, usecols=['Date(dd:mm:yyyy)'], dtype=str)
+    return pd.DatetimeIndex(pd.to_datetime(data['Date(dd:mm:yyyy)'], format='%d:%m:%Y', errors='coerce').dropna())
+
+
+def cached_days(aod_level):
+    """
+    :param aod_level: 10, 15 or 20
+    :return: DatetimeIndex of the days with data in all the cached responses (sorted, unique)
+    """
+    days = [read_raw(fn) for fn in sorted(glob(os.path.join(raw_folder, f'aeronet_{site}_L{aod_level}_*.csv')))]
+    if not days:
+        return pd.DatetimeIndex([])
+    return days[0].append(days[1:]).unique().sort_values()
 
-if __name__ == "__main__":
-    """**Get desired AERONET data using web services, then scraping data from website**"""
-
-    yr_initial = dt_initial[:4]  # initial year
-    mon_initial = dt_initial[4:6]  # initial month
-    day_initial = dt_initial[6:]  # initial day
 
-    yr_final = dt_final[:4]  # final year
-    mon_final = dt_final[4:6]  # final month
-    day_final = dt_final[6:]  # final day
+if __name__ == "__main__":
+    """**Get AERONET data using web services, only after the last day already ingested**"""
 
     if level == 1 or level == 1.0:
         level = 10
@@ -89,39 +153,31 @@ if __name__ == "__main__":
         print("\nIncorrect input for data level type. Defaulting to level 1.5...")
         level = 15
 
-    if level == 20 and int(
-            yr_initial) == datetime.date.today().year:  # if user wants level 2 data for the current year, program alerts that data may not be available
+    if level == 20 and ts.instr_metadata[instr]['start_instr'].year == datetime.date.today().year:
+        # if user wants level 2 data for the current year, program alerts that data may not be available
         level = 15  # defaults to level 1.5 data
         print("\nThere is no level 2 data available for the current year. Defaulting to level 1.5 data...")
 
-    url = 'https://aeronet.gsfc.nasa.gov/cgi-bin/print_web_data_v3?site=' + site + '&year=' + yr_initial + '&month=' + mon_initial + '&day=' + day_initial + '&year2=' + yr_final + '&month2=' + mon_final + '&day2=' + day_final + '&AOD' + str(
-            level) + '=1&AVG=20'
-    soup = BeautifulSoup(requests.get(url).text)  # web services contents are read here from URL
-
-    """**Writes soup data to text file, assigns contents to Pandas dataframe, prepares data for plotting**"""
-    with open(
-            os.path.join(ts.basefolder, 'thaao_aeronet', 'temp.txt'),
-            "w") as oFile:  # writes the data scraped from "beautiful soup" to a text file on your local Google drive
-        oFile.write(str(soup.text))
-        oFile.close()
-
-    df = pd.read_csv(
-            os.path.join(ts.basefolder, 'thaao_aeronet', 'temp.txt'),
-            skiprows=6)  # loads the csv data into a Pandas dataframe
-
-    if len(df) > 0:
-        df = df.replace(-999.0, np.nan)  # replaces all -999.0 vakyes with NaN; helps with accurate data aggregation
-        df[['Day', 'Month', 'Year']] = df['Date(dd:mm:yyyy)'].str.split(
-                ':', expand=True)  # splits the date column and then joins it back together using "-" instead of ":"
-        df['Date'] = df[['Year', 'Month', 'Day']].apply(
-                lambda x: '-'.join(x.values.astype(str)),
-                axis="columns")  # because datetime format in python does not recognize colons
-        df['Date'] = pd.to_datetime(df['Date'])  # converts the new date column to datetime format
+    # responses of the single requests made before the yearly cache: read until the cache replaces them
+    legacy = glob(os.path.join(raw_folder, f'aeronet_{site}_L{level}_????????_????????.csv'))
+    days = cached_days(level)
+    # the year of the last ingested day is requested again, as it may have been incomplete, and so are the next ones
+    end = ts.instr_metadata[instr]['end_instr']
+    if (len(days) > 0) & (not ts.scan_full_rebuild) & (not legacy):
+        start = days[-1]
     else:
+        start = ts.instr_metadata[instr]['start_instr']
+    try:
+        for year in range(start.year, end.year + 1):
+            fetch_raw(year, end, level)
+        for fn in legacy:
+            os.remove(fn)
+    except requests.RequestException as e:
+        print(f'AERONET not reachable ({e}): using the cached data only')
+    days = cached_days(level)
+
+    if len(days) == 0:
         print("No data to parse. Please retry with different parameters.")
 
-    aeronet = pd.DataFrame(columns=['dt', 'mask'])
-    for i in date_list:
-        if i in df['Date'].values:
-            aeronet.loc[i] = [i, True]
-    ts.save_txt(instr, aeronet)
+    aeronet = tls.avail_df(date_list, pd.DatetimeIndex(date_list).isin(days))
+    tls.save_txt(instr, aeronet)
@@ -0,0 +1,477 @@
+#!/usr/local/bin/python3
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+#
+"""
+Compact on-disk stores of the data availability, written next to the *_data_avail_list.txt files.
+"""
+
+# =============================================================
+# CREATED:
+# AFFILIATION: INGV
+# AUTHORS: Filippo Cali' Quaglia
+# =============================================================
+#
+# -------------------------------------------------------------------------------
+__author__ = "Filippo Cali' Quaglia"
+__credits__ = ["??????"]
+__license__ = "GPL"
+__version__ = "0.1"
+__email__ = "filippo.caliquaglia@ingv.it"
+__status__ = "Research"
+__lastupdate__ = "October 2024"
+
+import datetime as dt
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+import thaao_settings as ts
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # parquet output is optional
+    pa = None
+    pq = None
+
+# bitset header: magic, slot length [min], epoch [s from 1970-01-01]
+bitset_magic = b'TAV1'
+bitset_header = struct.Struct('<4sIq')
+bitset_epoch = dt.datetime(1900, 1, 1)
+
+
+def avail_folder(instr_nm):
+    """
+    Folder of the availability outputs of an instrument: thaao_<instr>, unless set in ts.avail_folders.
+    :param instr_nm: instrument name
+    :return: path
+    """
+    return os.path.join(ts.basefolder, ts.avail_folders.get(instr_nm, f'thaao_{instr_nm}'))
+
+
+def avail_file(instr_nm, ext):
+    """
+    Path of an availability store of an instrument, next to its text list.
+    :param instr_nm: instrument name
+    :param ext: extension of the store (e.g. 'bits')
+    :return: path
+    """
+    return os.path.join(avail_folder(instr_nm), f'{instr_nm}_data_avail.{ext}')
+
+
+def to_times_mask(times, mask):
+    """
+    Converts the two columns of an availability list to typed arrays, dropping unparsable times.
+    :param times: dates/times (strings, datetimes or datetime64)
+    :param mask: availability flags
+    :return: datetime64[ns] array, boolean array
+    """
+    times = pd.to_datetime(pd.Series(np.asarray(times)), errors='coerce').values
+    mask = np.asarray(mask)
+    if mask.dtype != bool:
+        mask = pd.Series(mask).astype(str).str.lower().isin(['true', '1', '1.0']).values
+    ok = ~np.isnat(times)
+    return times[ok], mask[ok]
+
+
+def read_bitset_header(fn):
+    """
+    :param fn: path of the bitset
+    :return: slot length (as timedelta64), epoch (as datetime64)
+    """
+    with open(fn, 'rb') as f:
+        magic, slot_min, epoch_s = bitset_header.unpack(f.read(bitset_header.size))
+    if magic != bitset_magic:
+        raise ValueError(f'{fn} is not an availability bitset')
+    return np.timedelta64(slot_min, 'm'), np.datetime64(epoch_s, 's')
+
+
+def save_bitset(fn, times, mask, append_from=None, slot_min=None):
+    """
+    Writes the availability as one bit per time slot (bit set: at least one valid sample in the slot). With
+    append_from, the existing bitset is cleared from that time on and updated in place.
+    :param fn: path of the bitset
+    :param times: sample times
+    :param mask: availability of each sample
+    :param append_from: None to rewrite the whole bitset, or datetime from which it is replaced
+    :param slot_min: slot length in minutes (default ts.bitset_slot; existing bitsets keep their own)
+    :return:
+    """
+    times, mask = to_times_mask(times, mask)
+
+    if (append_from is None) | (not os.path.exists(fn)):
+        slot = np.timedelta64(slot_min or ts.bitset_slot, 'm')
+        epoch = np.datetime64(bitset_epoch, 's')
+        with open(fn, 'wb') as f:
+            f.write(bitset_header.pack(bitset_magic, int(slot / np.timedelta64(1, 'm')), epoch.astype(np.int64)))
+        append_from = None
+    else:
+        slot, epoch = read_bitset_header(fn)
+
+    slots = ((times[mask] - epoch) // slot).astype(np.int64)
+    slots = slots[slots >= 0]
+    n_bytes = os.path.getsize(fn) - bitset_header.size
+    needed = int(slots.max()) // 8 + 1 if len(slots) else 0
+    if needed > n_bytes:
+        with open(fn, 'r+b') as f:
+            f.truncate(bitset_header.size + needed)
+        n_bytes = needed
+    if n_bytes == 0:
+        return
+
+    bits = np.memmap(fn, dtype=np.uint8, mode='r+', offset=bitset_header.size, shape=(n_bytes,))
+    if append_from is not None:
+        # the slot holding append_from is kept if it also has samples before append_from
+        first = max(-int((epoch - np.datetime64(append_from)) // slot), 0)
+        if first // 8 < n_bytes:
+            bits[first // 8] &= np.uint8((1 << (first % 8)) - 1)
+            bits[first // 8 + 1:] = 0
+    np.bitwise_or.at(bits, slots // 8, (1 << (slots % 8)).astype(np.uint8))
+    bits.flush()
+    del bits
+    return
+
+
+def read_bitset(fn, yy1, yy2):
+    """
+    Reads the availability between yy1 and yy2 from a bitset. The file is memory-mapped, so only the bytes of the
+    requested window are read from disk.
+    :param fn: path of the bitset
+    :param yy1: start of the window
+    :param yy2: end of the window
+    :return: boolean Series indexed by the start time of each slot in the window
+    """
+    slot, epoch = read_bitset_header(fn)
+    n_bytes = os.path.getsize(fn) - bitset_header.size
+    first = max(int((np.datetime64(pd.Timestamp(yy1)) - epoch) // slot), 0)
+    last = int((np.datetime64(pd.Timestamp(yy2)) - epoch) // slot)
+    if (n_bytes == 0) | (last < first):
+        return pd.Series(dtype=bool)
+
+    bits = np.memmap(fn, dtype=np.uint8, mode='r', offset=bitset_header.size, shape=(n_bytes,))
+    window = np.unpackbits(bits[first // 8:last // 8 + 1], bitorder='little')
+    window = window[first % 8:first % 8 + last - first + 1].astype(bool)
+    idx = epoch + slot * np.arange(first, first + len(window))
+    return pd.Series(window, index=pd.DatetimeIndex(idx.astype('datetime64[ns]')))
+
+
+def save_parquet(fn, times, mask, append_from=None):
+    """
+    Writes the availability as a Parquet file with a typed timestamp column 'dt' and a boolean column 'mask', one
+    row group per year. With append_from, the rows from that time on are replaced.
+    :param fn: path of the parquet file
+    :param times: sample times
+    :param mask: availability of each sample
+    :param append_from: None to rewrite the whole file, or datetime from which it is replaced
+    :return:
+    """
+    if pq is None:
+        print('pyarrow not installed: parquet availability not written')
+        return
+    times, mask = to_times_mask(times, mask)
+    data = pd.DataFrame({'dt': times, 'mask': mask})
+    if (append_from is not None) & os.path.exists(fn):
+        old = pq.read_table(fn, filters=[('dt', '<', pd.Timestamp(append_from))]).to_pandas()
+        data = pd.concat([old, data[data['dt'] >= pd.Timestamp(append_from)]], ignore_index=True)
+    data = data.sort_values('dt', kind='stable')
+
+    schema = pa.schema([('dt', pa.timestamp('ms')), ('mask', pa.bool_())])
+    years = data['dt'].dt.year.values
+    with pq.ParquetWriter(fn, schema) as writer:
+        for yy in np.unique(years):
+            writer.write_table(pa.Table.from_pandas(data[years == yy], schema=schema, preserve_index=False))
+    return
+
+
+def read_parquet(fn, yy1, yy2):
+    """
+    Reads the availability between yy1 and yy2 from a Parquet file. Row groups (years) outside the window are
+    skipped using their statistics, without being read.
+    :param fn: path of the parquet file
+    :param yy1: start of the window
+    :param yy2: end of the window
+    :return: boolean Series indexed by time
+    """
+    data = pq.read_table(
+            fn, columns=['dt', 'mask'],
+            filters=[('dt', '>=', pd.Timestamp(yy1)), ('dt', '<=', pd.Timestamp(yy2))]).to_pandas()
+    return pd.Series(data['mask'].values, index=pd.DatetimeIndex(data['dt']))
+
+
+def merge_intervals(starts, ends, max_gap=np.timedelta64(0, 'ns')):
+    """
+    Union of intervals with a sorted sweep: intervals overlapping or closer than max_gap are merged.
+    :param starts: start times of the intervals
+    :param ends: end times of the intervals
+    :param max_gap: largest gap still considered continuous
+    :return: starts, ends of the merged intervals (sorted, datetime64[ns])
+    """
+    starts = np.asarray(starts, dtype='datetime64[ns]')
+    ends = np.asarray(ends, dtype='datetime64[ns]')
+    if len(starts) == 0:
+        return starts, ends
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends)
+    new_run = np.ones(len(starts), dtype=bool)
+    new_run[1:] = starts[1:] > reach[:-1] + np.timedelta64(pd.Timedelta(max_gap))
+    first = np.flatnonzero(new_run)
+    last = np.r_[first[1:] - 1, len(starts) - 1]
+    return starts[first], reach[last]
+
+
+def mask_to_intervals(times, mask, max_gap):
+    """
+    Run-length encoding of an availability mask in one vectorized pass: consecutive valid samples closer than
+    max_gap form a single (start, end) interval.
+    :param times: sample times
+    :param mask: availability of each sample
+    :param max_gap: largest gap between valid samples still considered continuous (e.g. '60min')
+    :return: DataFrame with the columns ['start', 'end']
+    """
+    times, mask = to_times_mask(times, mask)
+    valid = np.sort(times[mask])
+    if len(valid) == 0:
+        return pd.DataFrame({'start': valid, 'end': valid})
+    brk = np.flatnonzero(np.diff(valid) > np.timedelta64(pd.Timedelta(max_gap)))
+    return pd.DataFrame({'start': valid[np.r_[0, brk + 1]], 'end': valid[np.r_[brk, len(valid) - 1]]})
+
+
+def interval_max_gap(instr_nm):
+    """
+    :param instr_nm: instrument name
+    :return: largest gap considered continuous for the instrument (ts.interval_max_gap)
+    """
+    return pd.Timedelta(ts.interval_max_gap.get(instr_nm, ts.interval_max_gap['default']))
+
+
+def save_intervals(fn, times, mask, max_gap, append_from=None):
+    """
+    Writes the availability as intervals of continuous valid data, one 'start end' line each. With append_from,
+    the intervals from that time on are replaced (an interval across append_from is cut there and merged again
+    with the new data if close enough).
+    :param fn: path of the interval list
+    :param times: sample times
+    :param mask: availability of each sample
+    :param max_gap: largest gap still considered continuous
+    :param append_from: None to rewrite the whole file, or datetime from which it is replaced
+    :return:
+    """
+    intervals = mask_to_intervals(times, mask, max_gap)
+    if (append_from is not None) & os.path.exists(fn):
+        append_from = pd.Timestamp(append_from)
+        intervals = intervals[intervals['end'] >= append_from]
+        intervals.loc[intervals['start'] < append_from, 'start'] = append_from
+        old = read_intervals(fn)
+        old = old[old['start'] < append_from]
+        old.loc[old['end'] >= append_from, 'end'] = append_from - pd.Timedelta(1, 's')
+        starts, ends = merge_intervals(
+                np.r_[old['start'].values, intervals['start'].values],
+                np.r_[old['end'].values, intervals['end'].values], max_gap)
+        intervals = pd.DataFrame({'start': starts, 'end': ends})
+    np.savetxt(
+            fn, np.c_[intervals['start'].dt.strftime('%Y-%m-%dT%H:%M:%S').values,
+                      intervals['end'].dt.strftime('%Y-%m-%dT%H:%M:%S').values], fmt='%s')
+    return
+
+
+def read_intervals(fn, yy1=None, yy2=None):
+    """
+    Reads an interval list, optionally keeping only the intervals overlapping [yy1, yy2].
+    :param fn: path of the interval list
+    :param yy1: start of the window (None: no limit)
+    :param yy2: end of the window (None: no limit)
+    :return: DataFrame with the columns ['start', 'end']
+    """
+    try:
+        intervals = pd.read_table(
+                fn, sep=' ', header=None, names=['start', 'end'], parse_dates=['start', 'end'],
+                date_format='%Y-%m-%dT%H:%M:%S')
+    except pd.errors.EmptyDataError:
+        intervals = pd.DataFrame({'start': [], 'end': []})
+    # an empty list (instrument without valid data) is read with object columns
+    intervals = intervals.astype({'start': 'datetime64[ns]', 'end': 'datetime64[ns]'})
+    if yy1 is not None:
+        intervals = intervals[intervals['end'] >= pd.Timestamp(yy1)]
+    if yy2 is not None:
+        intervals = intervals[intervals['start'] <= pd.Timestamp(yy2)]
+    return intervals.reset_index(drop=True)
+
+
+def intervals_to_slots(intervals, yy1, yy2, freq='720min'):
+    """
+    Availability on a regular grid from an interval list: a slot is available if any interval touches it.
+    :param intervals: DataFrame with the columns ['start', 'end']
+    :param yy1: start of the grid
+    :param yy2: end of the grid
+    :param freq: slot length
+    :return: boolean Series indexed by the start of each slot
+    """
+    grid = pd.date_range(pd.Timestamp(yy1).floor(freq), yy2, freq=freq)
+    first = grid.searchsorted(intervals['start'].values, side='right') - 1
+    last = grid.searchsorted(intervals['end'].values, side='right') - 1
+    first = np.clip(first, 0, None)
+    # +1 at the first slot of each interval and -1 after the last one, then a cumulative sum
+    cover = np.zeros(len(grid) + 1, dtype=np.int64)
+    np.add.at(cover, first, 1)
+    np.add.at(cover, last + 1, -1)
+    return pd.Series(np.cumsum(cover[:-1]) > 0, index=grid)
+
+
+def covered_time(starts, ends, edges):
+    """
+    Time covered by (disjoint) intervals between each pair of consecutive edges, with prefix sums over the sorted
+    starts and ends instead of a loop over the bins. Sums are exact (int64): the time covered up to an edge is the
+    length of the intervals ended before it plus the part of the one still open there, so an empty bin is exactly 0.
+    :param starts: start times of the intervals (sorted)
+    :param ends: end times of the intervals (sorted)
+    :param edges: bin edges (sorted)
+    :return: covered time in each bin [ns], len(edges) - 1 values
+    """
+    s = np.asarray(starts, dtype='datetime64[ns]').astype(np.int64)
+    e = np.asarray(ends, dtype='datetime64[ns]').astype(np.int64)
+    t = np.asarray(edges, dtype='datetime64[ns]').astype(np.int64)
+    # the intervals are disjoint, so the sum of their lengths never exceeds the time they span
+    cum_len = np.r_[0, np.cumsum(e - s)]
+    n_s = np.searchsorted(s, t, side='right')
+    n_e = np.searchsorted(e, t, side='right')
+    open_at = n_s > n_e  # the interval n_e has started but not ended at the edge
+    partial = np.where(open_at, t - s[np.minimum(n_e, len(s) - 1)] if len(s) else 0, 0)
+    return np.diff(cum_len[n_e] + partial)
+
+
+def sample_cadence(times, max_gap):
+    """
+    Typical spacing of the samples (median of the positive time differences), at most max_gap.
+    :param times: sample times
+    :param max_gap: upper limit of the cadence
+    :return: Timedelta, or None with less than two distinct samples
+    """
+    diffs = np.diff(np.unique(np.asarray(times, dtype='datetime64[ns]')))
+    if len(diffs) == 0:
+        return None
+    return min(pd.Timedelta(np.median(diffs.astype(np.int64))), pd.Timedelta(max_gap))
+
+
+def bin_floor(t, lev):
+    """
+    :param t: time
+    :param lev: bin length (pandas frequency, fixed or 'MS')
+    :return: start of the bin of length lev holding t
+    """
+    t = pd.Timestamp(t)
+    if lev.endswith('MS'):
+        return t.normalize().replace(day=1)
+    return t.floor(lev)
+
+
+def save_pyramid(fn, intervals, cadence, levels=None):
+    """
+    Precomputes the availability at several resolutions (ts.pyramid_levels, e.g. 1 h, 12 h, 1 day, 1 month) as the
+    fraction of each bin covered by data. Each run of valid data covers [start, end + cadence], so that isolated
+    daily samples cover their whole day. Levels are stored as separate arrays of one .npz file, so readers only
+    load the level they need.
+    :param fn: path of the pyramid (.npz)
+    :param intervals: DataFrame with the columns ['start', 'end'] (runs of valid data)
+    :param cadence: sample spacing, added to the end of each run (None: use the one stored in fn, or 0)
+    :param levels: list of bin lengths (pandas frequencies), default ts.pyramid_levels
+    :return:
+    """
+    levels = levels or ts.pyramid_levels
+    if cadence is None:
+        try:
+            cadence = pd.Timedelta(int(np.load(fn)['cadence']), 'ns')
+        except (FileNotFoundError, KeyError):
+            cadence = pd.Timedelta(0)
+    # without valid data the levels are written empty
+    starts = np.asarray(intervals['start'].values, dtype='datetime64[ns]')
+    ends = np.asarray(intervals['end'].values, dtype='datetime64[ns]') + np.timedelta64(cadence)
+    starts, ends = merge_intervals(starts, ends)
+    out = {'cadence': np.int64(cadence.value), 'levels': np.array(levels)}
+    for lev in levels:
+        if len(starts):
+            edges = pd.date_range(bin_floor(starts[0], lev), pd.Timestamp(ends[-1]), freq=lev)
+            edges = edges.append(pd.DatetimeIndex([edges[-1] + pd.tseries.frequencies.to_offset(lev)]))
+        else:
+            edges = pd.DatetimeIndex([])
+        frac = covered_time(starts, ends, edges) / np.diff(edges.values).astype(np.int64) if len(edges) else []
+        out[f'{lev}_bins'] = edges.values[:-1].astype('datetime64[ns]') if len(edges) else np.array([], 'M8[ns]')
+        out[f'{lev}_frac'] = np.asarray(frac, dtype=np.float32)
+    with open(fn, 'wb') as f:
+        np.savez(f, **out)
+    return
+
+
+def pyramid_level(levels, yy1, yy2, n_bins):
+    """
+    Coarsest level of the pyramid still giving at least n_bins bins between yy1 and yy2.
+    :param levels: bin lengths of the pyramid, from the finest
+    :param yy1: start of the window
+    :param yy2: end of the window
+    :param n_bins: wanted number of bins (e.g. the width of the plot in pixels)
+    :return: level (pandas frequency)
+    """
+    span = pd.Timestamp(yy2) - pd.Timestamp(yy1)
+    best = levels[0]
+    for lev in levels:
+        # a month is taken as 31 days
+        length = pd.Timedelta(days=31) if lev.endswith('MS') else pd.Timedelta(lev)
+        if span / length >= n_bins:
+            best = lev
+    return best
+
+
+def read_pyramid(fn, yy1, yy2, n_bins):
+    """
+    Reads from the pyramid the fraction of availability between yy1 and yy2 at the coarsest level giving about
+    n_bins bins.
+    :param fn: path of the pyramid (.npz)
+    :param yy1: start of the window
+    :param yy2: end of the window
+    :param n_bins: wanted number of bins
+    :return: Series of fractions indexed by the start of each bin, level used
+    """
+    with np.load(fn) as pyr:
+        lev = pyramid_level([str(x) for x in pyr['levels']], yy1, yy2, n_bins)
+        bins = pd.DatetimeIndex(pyr[f'{lev}_bins'])
+        frac = pyr[f'{lev}_frac']
+    first, last = bins.searchsorted(pd.Timestamp(yy1)), bins.searchsorted(pd.Timestamp(yy2), side='right')
+    return pd.Series(frac[first:last], index=bins[first:last]), lev
+
+
+def read_txt(fn):
+    """
+    Reads a text availability list (date time mask).
+    :param fn: path of the list
+    :return: Series of the mask indexed by time
+    """
+    data_val = pd.read_table(fn, sep=' ')
+    data_val.columns = ['date', 'time', 'mask']
+    data_val = data_val.set_index(pd.DatetimeIndex(data_val['date'] + 'T' + data_val['time']))
+    return data_val['mask']
+
+
+def read_avail(inp, yy1, yy2, n_bins=None):
+    """
+    Reads the availability of an instrument from the cheapest store enabled in ts.avail_formats that exists next to
+    its text list (pyramid if n_bins is given, then bitset, intervals, parquet and the text list itself).
+    :param inp: path of the text availability list
+    :param yy1: start of the window
+    :param yy2: end of the window
+    :param n_bins: about how many bins are needed in the window (e.g. plot width in pixels), for the pyramid
+    :return: DataFrame with the column 'mask', indexed by time
+    """
+    base = inp.replace('_data_avail_list.txt', '_data_avail')
+    if (n_bins is not None) & ('pyramid' in ts.avail_formats) & os.path.exists(base + '_pyramid.npz'):
+        frac = read_pyramid(base + '_pyramid.npz', yy1, yy2, n_bins)[0]
+        return (frac > ts.pyramid_min_fraction).to_frame('mask')
+    if ('bitset' in ts.avail_formats) & os.path.exists(base + '.bits'):
+        return read_bitset(base + '.bits', yy1, yy2).to_frame('mask')
+    if ('intervals' in ts.avail_formats) & os.path.exists(base + '_intervals.txt'):
+        return intervals_to_slots(read_intervals(base + '_intervals.txt', yy1, yy2), yy1, yy2).to_frame('mask')
+    if ('parquet' in ts.avail_formats) & (pq is not None) & os.path.exists(base + '.parquet'):
+        return read_parquet(base + '.parquet', yy1, yy2).to_frame('mask')
+    return read_txt(inp).to_frame('mask')
@@ -0,0 +1,235 @@
+#!/usr/local/bin/python3
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+#
+"""
+Local SQLite snapshot (path, size, mtime) of the files in the thaao_* folders of the basefolder, so that the scanners
+list and check files with local queries instead of round trips to the (network) drive.
+"""
+
+# =============================================================
+# CREATED:
+# AFFILIATION: INGV
+# AUTHORS: Filippo Cali' Quaglia
+# =============================================================
+#
+# -------------------------------------------------------------------------------
+__author__ = "Filippo Cali' Quaglia"
+__credits__ = ["??????"]
+__license__ = "GPL"
+__version__ = "0.1"
+__email__ = "filippo.caliquaglia@ingv.it"
+__status__ = "Research"
+__lastupdate__ = "October 2024"
+
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import thaao_settings as ts
+
+schema = ['CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime REAL)',
+          'CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, dir TEXT, size INTEGER, mtime REAL)',
+          'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)',
+          'CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent)',
+          'CREATE INDEX IF NOT EXISTS files_dir ON files (dir)']
+
+fresh = os.environ.get('THAAO_CATALOG_FRESH', '') == '1'  # already refreshed by the parent process (scan_all.py)
+local = threading.local()  # one connection per thread for the queries
+refresh_lock = threading.Lock()
+
+
+def connect():
+    """
+    :return: connection to the catalog (ts.catalog_file), with the tables created if needed
+    """
+    os.makedirs(os.path.dirname(ts.catalog_file), exist_ok=True)
+    con = sqlite3.connect(ts.catalog_file, timeout=60)
+    for sql in schema:
+        con.execute(sql)
+    return con
+
+
+def connection():
+    """
+    :return: connection of the current thread, kept open for the following queries
+    """
+    if getattr(local, 'con', None) is None:
+        local.con = connect()
+    return local.con
+
+
+def norm(path):
+    """
+    :param path: path
+    :return: normalized path, as stored in the catalog
+    """
+    return os.path.normpath(path)
+
+
+def in_scope(path):
+    """
+    :param path: path
+    :return: True if path is the basefolder or is inside one of its thaao_* folders
+    """
+    try:
+        rel = os.path.relpath(norm(path), norm(ts.basefolder))
+    except ValueError:  # another drive
+        return False
+    return (rel == '.') | (rel.split(os.sep)[0].startswith('thaao_'))
+
+
+def list_changed(path, mtime):
+    """
+    Stats a directory and lists it only if its mtime differs from the one in the catalog. A directory that cannot
+    be read (permissions, drive errors) is skipped: it keeps its previous content in the catalog.
+    :param path: directory
+    :param mtime: mtime of the directory in the catalog (None if not catalogued)
+    :return: path, current mtime (None if the directory is gone), (files, subdirs) or None if unchanged or unreadable
+    """
+    try:
+        current = os.stat(path).st_mtime
+        if current == mtime:
+            return path, current, None
+        files = []
+        subdirs = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        if (norm(path) != norm(ts.basefolder)) | entry.name.startswith('thaao_'):
+                            subdirs.append(norm(entry.path))
+                    else:
+                        st = entry.stat()
+                        files.append((norm(entry.path), norm(path), st.st_size, st.st_mtime))
+                except OSError as e:  # e.g. removed while listing
+                    print(f'catalog: cannot stat {entry.path} ({e}), skipped')
+    except (FileNotFoundError, NotADirectoryError):
+        return path, None, None
+    except OSError as e:
+        print(f'catalog: cannot list {path} ({e}), skipped')
+        return path, mtime, None
+    return path, current, (files, subdirs)
+
+
+def drop_tree(con, path):
+    """
+    Removes a directory and everything below it from the catalog.
+    :param con: connection to the catalog
+    :param path: directory
+    :return:
+    """
+    like = path.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + os.sep.replace('\\', '\\\\') + '%'
+    con.execute("DELETE FROM files WHERE dir = ? OR dir LIKE ? ESCAPE '\\'", (path, like))
+    con.execute("DELETE FROM dirs WHERE path = ? OR path LIKE ? ESCAPE '\\'", (path, like))
+    return
+
+
+def refresh(workers=None):
+    """
+    Brings the catalog up to date: every catalogued directory is stat-ed (concurrently) and only those whose own
+    mtime changed are listed again. Changes of size/mtime of a file that do not touch its directory are picked up
+    with ts.scan_full_rebuild (which relists everything).
+    :param workers: size of the thread pool (None: ts.scan_workers)
+    :return: number of directories listed again
+    """
+    global fresh
+    con = connect()
+    if ts.scan_full_rebuild:
+        con.execute('DELETE FROM dirs')
+        con.execute('DELETE FROM files')
+    mtimes = dict(con.execute('SELECT path, mtime FROM dirs'))
+    children = {}
+    for path, parent in con.execute('SELECT path, parent FROM dirs'):
+        children.setdefault(parent, []).append(path)
+
+    n_listed = 0
+    root = norm(ts.basefolder)
+    with con, ThreadPoolExecutor(max_workers=workers or ts.scan_workers) as executor:
+        pending = {executor.submit(list_changed, root, mtimes.get(root))}
+        parents = {root: ''}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, mtime, listing = future.result()
+                if mtime is None:
+                    drop_tree(con, path)
+                    continue
+                if listing is None:
+                    subdirs = children.get(path, [])
+                else:
+                    n_listed += 1
+                    files, subdirs = listing
+                    con.execute('DELETE FROM files WHERE dir = ?', (path,))
+                    con.executemany('INSERT INTO files VALUES (?, ?, ?, ?)', files)
+                    for old in set(children.get(path, [])) - set(subdirs):
+                        drop_tree(con, old)
+                    con.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)', (path, parents[path], mtime))
+                for sub in subdirs:
+                    parents[sub] = path
+                    pending.add(executor.submit(list_changed, sub, mtimes.get(sub)))
+        con.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('last_refresh', str(time.time())))
+    con.close()
+    fresh = True
+    print(f'catalog: {n_listed} directories listed again')
+    return n_listed
+
+
+def ensure_fresh():
+    """
+    Refreshes the catalog once per process, unless it was refreshed less than ts.catalog_max_age seconds ago.
+    :return:
+    """
+    global fresh
+    if fresh:
+        return
+    with refresh_lock:  # scanners query the catalog from several threads
+        if fresh:
+            return
+        last = connection().execute("SELECT value FROM meta WHERE key = 'last_refresh'").fetchone()
+        if (last is None) or (time.time() - float(last[0]) > ts.catalog_max_age) or ts.scan_full_rebuild:
+            refresh()
+        fresh = True
+    return
+
+
+def listing(path):
+    """
+    Content of a directory, from the catalog.
+    :param path: directory
+    :return: list of (path, size, mtime) of its files, list of its sub-directories; None if the directory is not
+    catalogued (out of scope, or missing)
+    """
+    if not in_scope(path):
+        return None
+    ensure_fresh()
+    path = norm(path)
+    con = connection()
+    if con.execute('SELECT 1 FROM dirs WHERE path = ?', (path,)).fetchone() is None:
+        return None
+    files = con.execute('SELECT path, size, mtime FROM files WHERE dir = ?', (path,)).fetchall()
+    subdirs = [row[0] for row in con.execute('SELECT path FROM dirs WHERE parent = ?', (path,))]
+    return files, subdirs
+
+
+def stat(path):
+    """
+    Size and mtime of a file or directory, from the catalog.
+    :param path: path
+    :return: (size, mtime) of a file, (None, mtime) of a directory, None if not catalogued
+    """
+    if not in_scope(path):
+        return None
+    ensure_fresh()
+    path = norm(path)
+    con = connection()
+    row = con.execute('SELECT size, mtime FROM files WHERE path = ?', (path,)).fetchone()
+    if row is None:
+        row = con.execute('SELECT NULL, mtime FROM dirs WHERE path = ?', (path,)).fetchone()
+    return row
+
+
+if __name__ == "__main__":
+    refresh()
@@ -21,13 +21,13 @@ __email__ = 'filippo.caliquaglia@ingv.it'
 __status__ = 'Research'
 __lastupdate__ = 'October 2024'
 
-import datetime as dt
 import os
-from glob import glob
+import re
 
 import numpy as np
 import pandas as pd
 
+import avail_store as avs
 import thaao_settings as ts
 import tools as tls
 
@@ -35,23 +35,48 @@ instr = 'ftir'
 date_list = pd.date_range(
         ts.instr_metadata[instr]['start_instr'], ts.instr_metadata[instr]['end_instr'], freq='D').tolist()
 folder = os.path.join(ts.basefolder, 'thaao_' + instr)
+# GEOMS file names: groundbased_ftir.<species>_<team>_thule_<start>_<end>_<version>.hdf
+fn_regex = re.compile(r'groundbased_ftir\.(?P<species>[^_]+)_[^_]+_thule_(?P<start>\d{8})[^_]*_(?P<end>\d{8})',
+                      re.IGNORECASE)
+
+
+def file_intervals(fol):
+    """
+    Lists the FTIR folder once and takes species, start and end day from the file names.
+    :param fol: FTIR folder
+    :return: DataFrame with the columns ['species', 'start', 'end']
+    """
+    files = tls.list_dir(fol, 0, stats=False)[0]
+    matches = [m.groupdict() for m in (fn_regex.match(os.path.basename(fn)) for fn, size, mtime in files) if m]
+    files = pd.DataFrame(matches, columns=['species', 'start', 'end'])
+    files['species'] = files['species'].str.lower()
+    files['start'] = pd.to_datetime(files['start'], format='%Y%m%d')
+    files['end'] = pd.to_datetime(files['end'], format='%Y%m%d')
+    return files
+
+
+def interval_days(starts, ends):
+    """
+    Days covered by a set of intervals: the intervals are first unioned with a sorted sweep, so that every day is
+    generated only once.
+    :param starts: start days
+    :param ends: end days
+    :return: DatetimeIndex of the covered days within date_list, sorted
+    """
+    starts, ends = avs.merge_intervals(starts, ends, max_gap='1D')
+    days = [pd.date_range(start, end, freq='D') for start, end in zip(starts, ends)]
+    days = pd.DatetimeIndex(np.concatenate(days) if days else [])
+    return days[(days >= date_list[0]) & (days <= date_list[-1])]
+
 
 if __name__ == "__main__":
-    ftir = pd.DataFrame()
-    for i in date_list:
-        fn = glob(
-                os.path.join(folder, 'groundbased_ftir.' + 'c2h6' + '_ncar001_thule_' + i.strftime('%Y%m%d') + '*'))
-        try:
-            if os.path.exists(fn[0]):
-                start = fn[0].split('_')[5]
-                end = fn[0].split('_')[6]
-                date_list_avail = pd.date_range(
-                        dt.datetime.strptime(start[0:8], '%Y%m%d'), dt.datetime.strptime(end[0:8], '%Y%m%d'),
-                        freq='D').tolist()
-                vals = np.repeat(True, len(date_list_avail))
-                ftir_t = pd.concat([pd.Series(date_list_avail), pd.Series(vals)], axis=1)
-            ftir = pd.concat([ftir_t, ftir], ignore_index=True)
-        except IndexError:
-            pass
+    files = file_intervals(folder)
+
+    # one list per species (ftir_<species>_data_avail_list.txt), next to the combined one in thaao_ftir
+    for species, intervals in files.groupby('species'):
+        ts.avail_folders.setdefault(f'{instr}_{species}', f'thaao_{instr}')
+        tls.save_txt(f'{instr}_{species}', tls.avail_df(interval_days(intervals['start'], intervals['end'])))
 
+    # combined list: days with any species
+    ftir = tls.avail_df(interval_days(files['start'], files['end']))
     tls.save_txt(instr, ftir)
@@ -21,21 +21,92 @@ __email__ = "filippo.caliquaglia@ingv.it"
 __status__ = "Research"
 __lastupdate__ = "October 2024"
 
-import datetime as dt
 import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import pandas as pd
 
 import thaao_settings as ts
+import tools as tls
 
 instr = 'hatpro'
 folder = os.path.join(ts.basefolder, "thaao_" + instr)
+fn_pattern = 'IWV_*.txt'
+chunk_rows = 1000000  # rows parsed at a time
+stop = threading.Event()  # set when the writer fails: the readers give up
+
+
+def read_iwv(fn, out):
+    """
+    Reads an IWV file chunk_rows rows at a time with the C parser and an explicit datetime format, keeping only
+    the time and IWV of each sample. Chunks are passed on as soon as they are parsed: out is bounded, so the reader
+    waits while the writer is behind and the memory stays flat.
+    :param fn: path of the IWV file
+    :param out: queue.Queue receiving the chunks (DataFrame indexed by datetime with the column 'IWV[kg/m2]',
+    float32), then None at the end of the file
+    :return:
+    """
+    print('Reading ' + fn)
+    try:
+        for chunk in pd.read_csv(fn, skiprows=10, header=None, sep=r'\s+', usecols=[0, 1, 2], engine='c',
+                                 names=['date', 'time', 'IWV[kg/m2]'], dtype=str, chunksize=chunk_rows):
+            put(out, pd.DataFrame(
+                    {'IWV[kg/m2]': pd.to_numeric(chunk['IWV[kg/m2]'], errors='coerce').astype(np.float32).values},
+                    index=pd.DatetimeIndex(
+                            pd.to_datetime(chunk['date'] + ' ' + chunk['time'], format='%Y-%m-%d %H:%M:%S'),
+                            name='datetime')))
+    finally:
+        put(out, None)  # also after an error, which the writer gets from the future
+    return
+
+
+def put(out, item):
+    """
+    Puts an item in a bounded queue, waiting while it is full unless the writer has stopped.
+    :param out: queue.Queue
+    :param item: item
+    :return:
+    """
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=1)
+            return
+        except queue.Full:
+            pass
+    raise RuntimeError('writer stopped')
+
+
+def write_chunks(out, append_from):
+    """
+    Writes the chunks of a file to the mask as they are parsed.
+    :param out: queue.Queue filled by read_iwv
+    :param append_from: first datetime to write (None: the mask is rewritten)
+    :return: first datetime to write after this file
+    """
+    while (chunk := out.get()) is not None:
+        chunk = chunk.sort_index()
+        if chunk.empty | ((append_from is not None) and (chunk.index[-1] < append_from)):
+            continue
+        tls.save_mask_txt(chunk, instr, append_from=append_from)
+        append_from = chunk.index[-1] + pd.Timedelta(seconds=1)
+    return append_from
+
 
 if __name__ == "__main__":
-    dateparse = lambda x: dt.datetime.strptime(x, '%Y-%m-%d %H:%M:%S')
-    data_avail_hat = pd.read_table(
-            os.path.join(ts.basefolder, "thaao_hatpro", 'IWV_20170101_20220919.txt'), skiprows=10, header=None,
-            delim_whitespace=True, parse_dates={'datetime': [0, 1]}, date_parser=dateparse, index_col='datetime')
-    data_avail_hat.columns = ['IWV[kg/m2]', 'STD_IWV[kg/m2]', 'Num']
+    fns = tls.dir_index(folder, fn_pattern).get('', [])
 
-    ts.save_mask_txt(data_avail_hat['IWV[kg/m2]'], instr)
+    # ts.scan_workers files are parsed at a time (the others wait in the pool) and each holds at most a few chunks
+    # in its queue; the chunks are written one file after the other, in time order
+    append_from = None  # the first chunk rewrites the mask, the next ones are appended
+    with ThreadPoolExecutor(max_workers=ts.scan_workers) as executor:
+        queues = [queue.Queue(maxsize=2) for _ in fns]
+        futures = [executor.submit(read_iwv, fn, out) for fn, out in zip(fns, queues)]
+        try:
+            for out, future in zip(queues, futures):
+                append_from = write_chunks(out, append_from)
+                future.result()  # errors of the reader
+        finally:
+            stop.set()  # the readers still running would wait forever on their full queues
@@ -22,29 +22,38 @@ __status__ = "Research"
 __lastupdate__ = "October 2024"
 
 import os
-from glob import glob
 
+import numpy as np
 import pandas as pd
 
 import thaao_settings as ts
+import tools as tls
 
 instr = 'lidar_temp'
 date_list = pd.date_range(
         ts.instr_metadata[instr]['start_instr'], ts.instr_metadata[instr]['end_instr'], freq='D').tolist()
 folder = os.path.join(ts.basefolder, "thaao_" + instr)
+fn_pattern_old = 'WWW-AIR_1685207569988/thte%y%m.*'  # until 2020
+fn_pattern_new = '%y%m%d.zip'
 
 if __name__ == "__main__":
 
-    lidar_temp = pd.DataFrame(columns=['dt', 'mask'])
-
-    for i in date_list:
+    fn_index_old = tls.dir_index(folder, fn_pattern_old)
+    fn_index_new = tls.dir_index(folder, fn_pattern_new)
+    # a daily archive counts only if it holds data; one filled in place is rescanned from its day
+    zip_members, stale = tls.zip_index(instr, [fns[0] for fns in fn_index_new.values()])
+    stale_days = pd.to_datetime([os.path.basename(fn)[:6] for fn in stale], format='%y%m%d', errors='coerce')
+    scan_dates, append_from, scan_state = tls.scan_period(
+            instr, date_list, {os.path.join(folder, 'WWW-AIR_1685207569988'): date_list[0], folder: None},
+            stale_days.min().to_pydatetime() if stale_days.notna().any() else None)
+    fn_index_new = {key: fns for key, fns in fn_index_new.items() if zip_members[fns[0]]}
+    found = np.zeros(len(scan_dates), dtype=bool)
+    for idx, i in enumerate(scan_dates):
         if i.year <= 2020:
-            fn = os.path.join(folder, 'WWW-AIR_1685207569988', 'thte' + i.strftime('%y%m') + '.*')
-            if glob(fn):
-                lidar_temp.loc[i] = [i, True]
+            found[idx] = tls.date_key(i, fn_pattern_old) in fn_index_old
         else:
-            fn = os.path.join(folder, i.strftime('%y%m%d') + '.zip')
-            if glob(fn):
-                lidar_temp.loc[i] = [i, True]
+            found[idx] = tls.date_key(i, fn_pattern_new) in fn_index_new
+    lidar_temp = tls.avail_df(scan_dates, found)
 
-    ts.save_txt(instr, lidar_temp)
+    tls.save_txt(instr, lidar_temp, append_from=append_from)
+    tls.save_scan_state(instr, scan_state)
@@ -22,47 +22,47 @@ __status__ = "Research"
 __lastupdate__ = "October 2024"
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-import numpy as np
 import pandas as pd
 
 import thaao_settings as ts
+import tools as tls
 
+stations = [1, 2, 3, 4]
 
-if __name__ == "__main__":
 
-    for station in [1, 2, 3, 4]:
-        instr = f'macmap_seismometer_{station}'
-        date_list = pd.date_range(
-                ts.instr_metadata[instr]['start_instr'], ts.instr_metadata[instr]['end_instr'], freq='D').tolist()
-        folder = os.path.join(ts.basefolder, "thaao_" + instr)
+def listed_days(fn):
+    """
+    Builds the index of the days in a station listing, whose entries end with the day as YYYY.jjj (optionally
+    followed by a '*').
+    :param fn: path of the listing (lista_TH0n.txt)
+    :return: DatetimeIndex of the listed days, unique
+    """
+    entries = pd.read_table(fn, header=None, dtype=str).iloc[:, 0]
+    days = entries.str.extract(r'(\d{4}\.\d{3})\W*$', expand=False).dropna()
+    return pd.DatetimeIndex(pd.to_datetime(days, format='%Y.%j')).unique()
+
 
-        fn = os.path.join(folder, f"lista_TH0{station}.txt")
-        list_file = pd.read_table(fn)
-        date_converted = []
-        for i in list_file.values:
-            if str(i[0][-1]) == '*':
-                val = str(i[0][-9:-2])
-            else:
-                val = str(i[0][-8:])
-            date_converted.append(val)
+def scan_station(station):
+    """
+    Saves the availability of one station: days in its listing plus the manual ranges in ts.manual_avail.
+    :param station: station number
+    :return: instrument name
+    """
+    instr = f'macmap_seismometer_{station}'
+    date_list = pd.date_range(ts.instr_metadata[instr]['start_instr'], ts.instr_metadata[instr]['end_instr'],
+                              freq='D')
+    folder = os.path.join(ts.basefolder, "thaao_" + instr)
 
-        if station == 1:
-            for man_dat in np.arange(125, 155):
-                date_converted.append('2023.' + str(man_dat))
-        if station == 2:
-            for man_dat in np.arange(113, 120):
-                date_converted.append('2023.' + str(man_dat))
-        if station == 3:
-            for man_dat in np.arange(110, 155):
-                date_converted.append('2023.' + str(man_dat))
-        if station == 4:
-            for man_dat in np.arange(113, 155):
-                date_converted.append('2023.' + str(man_dat))
+    found = date_list.isin(listed_days(os.path.join(folder, f"lista_TH0{station}.txt")))
+    macmap_seismo = tls.avail_df(date_list.tolist(), found | tls.manual_mask(instr, date_list))
 
-        macmap_seismo = pd.DataFrame(columns=['dt', 'mask'])
-        for i in date_list:
-            if i.strftime('%Y.%j') in date_converted:
-                macmap_seismo.loc[i] = [i, True]
+    tls.save_txt(instr, macmap_seismo)
+    return instr
 
-        ts.save_txt(instr, macmap_seismo)
+
+if __name__ == "__main__":
+    with ThreadPoolExecutor(max_workers=len(stations)) as executor:
+        for instr in executor.map(scan_station, stations):
+            print(instr + ' done')
@@ -21,32 +21,49 @@ __email__ = "filippo.caliquaglia@ingv.it"
 __status__ = "Research"
 __lastupdate__ = "October 2024"
 
-import datetime as dt
 import os
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import pandas as pd
 
 import thaao_settings as ts
+import tools as tls
 
 instr = 'macmap_tide_gauge'
 date_list = pd.date_range(
         ts.instr_metadata[instr]['start_instr'], ts.instr_metadata[instr]['end_instr'], freq='D').tolist()
 folder = os.path.join(ts.basefolder, "thaao_" + instr)
+fn_pattern = 'Thule_%y%m.dat'
+
+
+def read_month(fn):
+    """
+    Reads the record dates of a monthly file (first column, ' dd/mm/YYYY'), parsed with an explicit format.
+    :param fn: path of the monthly file
+    :return: DatetimeIndex of the records (one element per record)
+    """
+    list_file = pd.read_table(fn, sep='|', usecols=[0], dtype=str)
+    return pd.DatetimeIndex(pd.to_datetime(list_file.iloc[:, 0], format=' %d/%m/%Y', errors='coerce').dropna())
+
 
 if __name__ == "__main__":
 
-    dateparse = lambda x: dt.datetime.strptime(x, ' %d/%m/%Y')
-    date_converted = pd.DataFrame()
-    for i in date_list:
-        try:
-            fn = os.path.join(folder, "Thule_" + i.strftime('%y%m') + ".dat")
-            list_file = pd.read_table(fn, sep='|', parse_dates={'datetime': [0]}, date_parser=dateparse)
-            date_converted = pd.concat([date_converted, list_file['datetime'].drop_duplicates()])
-        except FileNotFoundError:
-            print('file ' + str(fn) + ' not found')
-
-    macmap_tide_gauge = pd.DataFrame(columns=['dt', 'mask'])
-    for i in date_list:
-        if i.strftime('%Y-%m-%d') in pd.to_datetime(date_converted.values.flatten()):
-            macmap_tide_gauge.loc[i] = [i, True]
-    ts.save_txt(instr, macmap_tide_gauge)
+    # monthly files are listed once and each of them is read once
+    months = {pd.Timestamp(i).strftime('%y%m') for i in date_list}
+    fn_index = tls.dir_index(folder, fn_pattern)
+    fns = [fn_index[key][0] for key in sorted(fn_index) if key in months]
+    print(f'{len(fns)} monthly files, {len(months) - len(fns)} months without file')
+
+    with ThreadPoolExecutor(max_workers=ts.scan_workers) as executor:
+        records = list(executor.map(read_month, fns))
+    records = records[0].append(records[1:]) if records else pd.DatetimeIndex([])
+
+    # records per day (sub-daily coverage), from a single groupby
+    counts = pd.Series(np.ones(len(records), dtype=int), index=records).groupby(level=0).size()
+    np.savetxt(os.path.join(ts.basefolder, "thaao_" + instr, instr + '_daily_counts.txt'),
+               pd.concat([pd.Series(counts.index), pd.Series(counts.values)], axis=1), fmt='%s')
+
+    found = pd.DatetimeIndex(date_list).isin(counts.index[counts > 0])
+    macmap_tide_gauge = tls.avail_df(date_list, found)
+    tls.save_txt(instr, macmap_tide_gauge)
@@ -21,37 +21,116 @@ __email__ = "filippo.caliquaglia@ingv.it"
 __status__ = "Research"
 __lastupdate__ = "October 2024"
 
+import datetime as dt
+import json
 import os
 from urllib.request import urlopen
 
-import numpy as np
 import pandas as pd
 
 import thaao_settings as ts
+import tools as tls
 
 instr = 'metar'
 
 folder = os.path.join(ts.basefolder, instr)
+first_year = 1928  # first year in the Iowa mesonet archive
+chunk_rows = 200000  # rows parsed at a time
+chunks_file = os.path.join(folder, 'BGTL_METAR_chunks.json')  # period downloaded in each chunk
 
-if __name__ == "__main__":
-    url = (
-            'https://mesonet.agron.iastate.edu/cgi-bin/request/asos.py?station=BGTL&data=all&year1=1928&month1=1&day1=1&year2=' + str(
-            ts.instr_metadata['macmap_tide_gauge']['end_instr'].year) + '&month2=' + str(
-            ts.instr_metadata['macmap_tide_gauge']['end_instr'].month) + '&day2=' + str(
-            ts.instr_metadata['macmap_tide_gauge'][
-                'end_instr'].day) + '&tz=Etc%2FUTC&format=onlycomma&latlon=no&elev=no&missing=M&trace=T&direct=no&report_type=3&report_type=4')
 
+def chunk_file(year):
+    """
+    :param year: year of the chunk
+    :return: path of the yearly chunk of the archive
+    """
+    return os.path.join(folder, f'BGTL_METAR_{year}.csv')
+
+
+def load_fetched():
+    """
+    :return: dict {year: end (excluded) of the period downloaded in its chunk, 'YYYY-MM-DD'}
+    """
+    try:
+        with open(chunks_file, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def chunk_complete(year, fetched):
+    """
+    A chunk is complete if it was downloaded up to the end of its year. Chunks without a record (downloaded before
+    the records were kept) are complete if written after the end of their year.
+    :param year: year of the chunk
+    :param fetched: records of the chunks, as returned by load_fetched
+    :return: True if the chunk exists and covers its whole year
+    """
+    if not os.path.exists(chunk_file(year)):
+        return False
+    year_end = dt.datetime(year + 1, 1, 1)
+    if str(year) in fetched:
+        return dt.datetime.strptime(fetched[str(year)], '%Y-%m-%d') >= year_end
+    return dt.datetime.fromtimestamp(os.path.getmtime(chunk_file(year))) >= year_end
+
+
+def fetch_chunk(year, end):
+    """
+    Downloads the METAR reports of one year (valid time and report only), streaming the response to disk.
+    :param year: year of the chunk
+    :param end: last day of the archive (the open chunk stops there)
+    :return: path of the chunk, end (excluded) of the period downloaded
+    """
+    d1 = dt.datetime(year, 1, 1)
+    d2 = min(dt.datetime(year + 1, 1, 1), end + dt.timedelta(days=1))
+    url = ('https://mesonet.agron.iastate.edu/cgi-bin/request/asos.py?station=BGTL&data=metar' + d1.strftime(
+            '&year1=%Y&month1=%m&day1=%d') + d2.strftime(
+            '&year2=%Y&month2=%m&day2=%d') + '&tz=Etc%2FUTC&format=onlycomma&latlon=no&elev=no&missing=M&trace=T'
+                                             '&direct=no&report_type=3&report_type=4')
     print(url)
-    response = urlopen(url, timeout=10000)
+    fn = chunk_file(year)
+    with urlopen(url, timeout=600) as response, open(fn + '.part', 'wb') as f:
+        while block := response.read(1 << 16):
+            f.write(block)
+    os.replace(fn + '.part', fn)  # an interrupted download does not leave a broken chunk
+    return fn, d2
+
+
+def read_chunk(fn):
+    """
+    Reads the valid times of a chunk, parsing only the valid and metar columns, chunk_rows rows at a time.
+    :param fn: path of the chunk
+    :return: DatetimeIndex of the reports
+    """
+    times = [pd.to_datetime(part['valid'], format='%Y-%m-%d %H:%M') for part in
+             pd.read_csv(fn, usecols=['valid', 'metar'], dtype=str, chunksize=chunk_rows)]
+    return pd.DatetimeIndex(pd.concat(times)) if times else pd.DatetimeIndex([])
+
+
+if __name__ == "__main__":
+    os.makedirs(folder, exist_ok=True)
+    end = ts.instr_metadata[instr]['end_instr']
+    avail_list = os.path.join(ts.basefolder, f'thaao_{instr}', f'{instr}_data_avail_list.txt')
 
-    with open(os.path.join(folder, 'BGTL_METAR.csv'), 'wb') as f:
-        f.write(response.read())
+    # closed years are downloaded only once they are complete: the open one (the last) at every run, and the
+    # chunk of a year that was still open at the last download once more after its end
+    chunks = load_fetched()
+    fetched = [year for year in range(first_year, end.year + 1) if
+               (year == end.year) | (not chunk_complete(year, chunks)) | ts.scan_full_rebuild]
+    for year in fetched:
+        fn, d2 = fetch_chunk(year, end)
+        chunks[str(year)] = d2.strftime('%Y-%m-%d')
+        with open(chunks_file, 'w') as f:
+            json.dump(chunks, f, indent=1)
 
-    historical_data_all = pd.read_csv(os.path.join(folder, 'BGTL_METAR.csv'), low_memory=False, index_col='valid')
-    historical_data_metar = historical_data_all['metar']
-    del historical_data_all
+    if (fetched == list(range(fetched[0], end.year + 1))) & os.path.exists(avail_list) & (not ts.scan_full_rebuild):
+        # only the last chunks changed: the list is kept up to the first day of the oldest and they are appended
+        years = fetched
+        append_from = dt.datetime(fetched[0], 1, 1)
+    else:
+        years = range(first_year, end.year + 1)
+        append_from = None
 
-    # TODO: modificare usando ts.save_mask_txt
-    vals = np.repeat(True, len(historical_data_metar))
-    metar = pd.concat([pd.Series(historical_data_metar.index), pd.Series(vals)], axis=1)
-    ts.save_txt(instr, metar)
+    times = [read_chunk(chunk_file(year)) for year in years]
+    metar = tls.avail_df(times[0].append(times[1:]))
+    tls.save_txt(instr, metar, append_from=append_from)
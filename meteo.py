@@ -22,45 +22,156 @@ __status__ = "Research"
 __lastupdate__ = "October 2024"
 
 import datetime as dt
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 
+import netCDF4
 import pandas as pd
 
 import thaao_settings as ts
+import tools as tls
 
 instr = 'meteo'
 folder = os.path.join(ts.basefolder, "thaao_" + instr)
 
+fol_weekly = os.path.join(folder, 'weekly')
+fn_nc = os.path.join(folder, 'Meteo_weekly_all.nc')
+fn_manifest = os.path.join(folder, 'Meteo_weekly_manifest.json')  # weekly files already merged in fn_nc
+time_units = 'seconds since 1970-01-01 00:00:00'
+
+# columns of the weekly files, by number of fields (the inclinometer angles were added later)
+weekly_columns = {7: ["TIMESTAMP", "RECORD", "BP_hPa", "Air_K", "RH_%", "Angle_X", "Angle_Y"],
+                  5: ["TIMESTAMP", "RECORD", "BP_hPa", "Air_K", "RH_%"]}
+
+
+def list_weekly():
+    """
+    Lists the weekly files from Giovanni once, with size and mtime from the drive (a file rewritten in place is
+    merged again).
+    :return: dict {file path: [size, mtime]}
+    """
+    fns = [fn for fn, _, _ in tls.list_dir(fol_weekly, 0, stats=False)[0] if
+           os.path.basename(fn).startswith('DatiMeteoThule')]
+    stats = {fn: tls.file_stat(fn, on_drive=True) for fn in fns}
+    return {fn: list(st) for fn, st in stats.items() if st is not None}
+
+
+def load_manifest():
+    """
+    :return: dict {file path: [size, mtime]} of the weekly files merged by the last run ({} if none)
+    """
+    if ts.scan_full_rebuild | (not os.path.exists(fn_nc)):
+        return {}
+    try:
+        with open(fn_manifest, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_manifest(manifest):
+    """
+    :param manifest: dict {file path: [size, mtime]} of the weekly files merged in the NetCDF
+    :return:
+    """
+    with open(fn_manifest, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return
+
+
+def file_schema(fn):
+    """
+    Detects the columns of a weekly file from its first data line, so that it is parsed only once.
+    :param fn: path of the weekly file
+    :return: list of column names
+    """
+    with open(fn, 'r') as f:
+        for _ in range(4):
+            f.readline()
+        n_fields = len(f.readline().split(','))
+    return weekly_columns[n_fields]
+
+
+def read_weekly(fn):
+    """
+    Reads a weekly file, keeping pressure (converted to hPa), temperature and relative humidity.
+    :param fn: path of the weekly file
+    :return: DataFrame indexed by TIMESTAMP
+    """
+    print(fn)
+    file = pd.read_table(fn, skiprows=4, header=None, delimiter=',', names=file_schema(fn), na_values=['NAN'],
+                         usecols=["TIMESTAMP", "BP_hPa", "Air_K", "RH_%"], index_col='TIMESTAMP')
+    file.index = pd.DatetimeIndex(file.index)
+    file["BP_hPa"] *= 10  # conversion to hPa
+    return file
+
+
+def read_all_weekly(fns):
+    """
+    Reads weekly files in parallel and merges them once.
+    :param fns: list of file paths
+    :return: DataFrame sorted by time, without duplicated times
+    """
+    with ThreadPoolExecutor(max_workers=ts.scan_workers) as executor:
+        data = list(executor.map(read_weekly, fns))
+    all_weekly = pd.concat(data).sort_index()
+    return all_weekly[~all_weekly.index.duplicated(keep='first')]
+
+
+def append_netcdf(data):
+    """
+    Appends new times to Meteo_weekly_all.nc along its unlimited TIMESTAMP dimension. Weekly files overlap: the
+    times already in the file are kept (as duplicated(keep='first') does in a full merge) and the others appended.
+    :param data: DataFrame of the new weeks
+    :return: DataFrame of the rows appended, or None if some of them are earlier than the last time in the file
+    (a week arriving late: a rebuild is needed)
+    """
+    with netCDF4.Dataset(fn_nc, 'a') as nc:
+        time = nc.variables['TIMESTAMP']
+        n = len(time)
+        if n > 0:
+            merged = pd.DatetimeIndex(netCDF4.num2date(time[:], time.units, only_use_cftime_datetimes=False))
+            data = data[~data.index.isin(merged)]
+            if (not data.empty) and (data.index[0] <= merged.max()):
+                return None
+        if data.empty:
+            return data
+        time[n:] = netCDF4.date2num(data.index.to_pydatetime(), time.units)
+        for col in data.columns:
+            nc.variables[col][n:] = data[col].values
+    return data
+
+
 if __name__ == "__main__":
 
     start = dt.datetime(2016, 3, 8, 0, 0, 0)
     days = 2000
 
-    # merge together all the weekly files from Giovanni
-    import glob
-
-    ls_f = glob.glob(os.path.join(folder, 'weekly', 'DatiMeteoThule*'))
-    all_weekly = pd.DataFrame()
-    for f in ls_f:
-        print(f)
-        try:
-            file = pd.read_table(f, skiprows=4, header=None, delimiter=',')
-            file[2] *= 10  # conversion to hPa
-            file.columns = ["TIMESTAMP", "RECORD", "BP_hPa", "Air_K", "RH_%", "Angle_X", "Angle_Y"]
-            file.index = pd.DatetimeIndex(file['TIMESTAMP'])
-            file.drop(columns=["RECORD", "TIMESTAMP", "Angle_X", "Angle_Y"], inplace=True)
-        except ValueError:
-            file = pd.read_table(f, skiprows=4, header=None, delimiter=',')
-            file[2] *= 10  # conversion to hPa
-            file.columns = ["TIMESTAMP", "RECORD", "BP_hPa", "Air_K", "RH_%"]
-            file.index = pd.DatetimeIndex(file['TIMESTAMP'])
-            file.drop(columns=["RECORD", "TIMESTAMP"], inplace=True)
-
-        all_weekly = pd.concat([all_weekly, file])
-
-    all_weekly.sort_index(inplace=True)
-    all_weekly = all_weekly[~all_weekly.index.duplicated(keep='first')]
-    all_weekly_xr = all_weekly.to_xarray()
-    all_weekly_xr.to_netcdf(os.path.join(folder, 'Meteo_weekly_all.nc'))
-
-    ts.save_mask_txt(all_weekly['Air_K'], 'aws(p,T,RH)')
+    # merge together the weekly files from Giovanni not yet merged
+    current = list_weekly()
+    manifest = load_manifest()
+    new_files = sorted(fn for fn in current if fn not in manifest)
+    changed = [fn for fn in manifest if manifest[fn] != current.get(fn)]
+
+    if manifest and (not changed):
+        if not new_files:
+            print('no new weekly files')
+        else:
+            new_weekly = append_netcdf(read_all_weekly(new_files))
+            if new_weekly is None:
+                print('new weekly files earlier than the merged period: rebuilding')
+                manifest = {}
+            else:
+                save_manifest(current)
+                if not new_weekly.empty:
+                    tls.save_mask_txt(new_weekly[['Air_K']], 'aws(p,T,RH)', append_from=new_weekly.index.min())
+    else:
+        manifest = {}
+
+    if (not manifest) & bool(current):
+        all_weekly = read_all_weekly(sorted(current))
+        all_weekly.to_xarray().to_netcdf(
+                fn_nc, unlimited_dims=['TIMESTAMP'], encoding={'TIMESTAMP': {'units': time_units, 'dtype': 'float64'}})
+        save_manifest(current)
+        tls.save_mask_txt(all_weekly[['Air_K']], 'aws(p,T,RH)')
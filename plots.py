@@ -35,11 +35,13 @@ from matplotlib.lines import Line2D
 from matplotlib.pyplot import cm
 from PIL import Image, ImageDraw
 
+import avail_store as avs
 import thaao_settings as ts
 import tools as tls
 
 dpi_fac = 2  # if increased, dpi resolution increases
 dpi = 300 * dpi_fac
+na_levels = ['720min', '1D', '1MS']  # grids for the 'not available' background, the coarsest fitting is used
 
 
 def plot_data_avail(ax, inp, yy1, yy2, idx):
@@ -53,18 +55,22 @@ def plot_data_avail(ax, inp, yy1, yy2, idx):
     :return:
     """
 
+    # about one bin per pixel of the saved panel is enough
+    n_px = int(ax.bbox.width / ax.figure.dpi * dpi)
+    na_freq = avs.pyramid_level(na_levels, yy1, yy2, n_px)
+
     # data
     try:
-        data_val = pd.read_table(inp, sep=' ')
-        data_val.columns = ['date', 'time', 'mask']
-        data_val = data_val.set_index(pd.DatetimeIndex(data_val['date'] + 'T' + data_val['time']))
-        data_val = data_val.drop(columns=['date', 'time'])
+        # bitset/parquet stores are read only between yy1 and yy2, the pyramid at the resolution of the panel
+        data_val = avs.read_avail(inp, yy1, yy2, n_bins=n_px)
         missing_switch = 0
     except FileNotFoundError:
         missing_switch = 1
         data_val = pd.DataFrame(data=np.empty((0, 2)))
         data_val.columns = ['datetime', 'mask']
-        data_val['datetime'] = pd.date_range(dt.datetime(1900, 1, 1), dt.datetime.today(), freq='720min')
+        data_val['datetime'] = pd.date_range(
+                max(pd.Timestamp(yy1), pd.Timestamp(1900, 1, 1)), min(pd.Timestamp(yy2), pd.Timestamp.today()),
+                freq=na_freq)
         data_val = data_val.set_index(pd.DatetimeIndex(data_val['datetime']))
         data_val = data_val.drop(columns=['datetime'])
         data_val['mask'] = True
@@ -74,28 +80,19 @@ def plot_data_avail(ax, inp, yy1, yy2, idx):
 
         # data na
         data_na = pd.DataFrame()
-        data_na['date'] = pd.date_range(yy1, yy2, freq='720min')
-        data_na['mask'] = np.empty(data_na['date'].shape)
-        data_na['mask'] = False
+        data_na['date'] = pd.date_range(yy1, yy2, freq=na_freq)
         data_na.index = data_na['date']
         data_na.drop(columns=['date'], inplace=True)
+        metadata = ts.instr_metadata.get(ts.instr_list[idx])
 
         # excluding seasonal unavailability
-        for i, ii in enumerate(data_na.index):
-            if (ii.month > pd.Timestamp(ts.instr_metadata.get(ts.instr_list[idx])['end_seas']).month) | (
-                    ii.month < pd.Timestamp(ts.instr_metadata.get(ts.instr_list[idx])['start_seas']).month):
-                if data_na['mask'].iloc[i] != True:
-                    data_na.loc[ii, 'mask'] = True
-            else:
-                data_na.loc[ii, 'mask'] = False
+        months = data_na.index.month
+        data_na['mask'] = (months > pd.Timestamp(metadata['end_seas']).month) | (
+                months < pd.Timestamp(metadata['start_seas']).month)
 
         # excluding instrument missing or not installed
-        for i, ii in enumerate(data_na.index):
-            if (ii < pd.Timestamp(ts.instr_metadata.get(ts.instr_list[idx])['start_instr'])) | (
-                    ii > pd.Timestamp(ts.instr_metadata.get(ts.instr_list[idx])['end_instr'])):
-                data_na.loc[ii, 'mask'] = True
-            else:
-                pass
+        data_na.loc[(data_na.index < pd.Timestamp(metadata['start_instr'])) | (
+                data_na.index > pd.Timestamp(metadata['end_instr'])), 'mask'] = True
 
         data_na = data_na['mask'].astype('int')
         ys_1 = np.repeat(idx, len(data_na.index[data_na == 1].values))
@@ -23,10 +23,10 @@ __lastupdate__ = "October 2024"
 
 import os
 
-import numpy as np
 import pandas as pd
 
 import thaao_settings as ts
+import tools as tls
 
 instr = 'pm10'
 date_list = pd.date_range(
@@ -34,12 +34,9 @@ date_list = pd.date_range(
 folder = os.path.join(ts.basefolder, 'thaao_' + instr)
 
 if __name__ == "__main__":
-    pm10_tmp = pd.DataFrame(columns=['dt', 'mask'])
-
     fn = os.path.join(folder, 'Thule_2010_sampling_3mag23_modificato_per_data_availability.xls')
     pm10_tmp = pd.read_excel(fn, index_col=0)
-    vals = np.repeat(True, len(pm10_tmp))
 
-    pm10 = pd.concat([pd.Series(pd.DatetimeIndex(pm10_tmp.index)), pd.Series(vals)], axis=1)
+    pm10 = tls.avail_df(pd.DatetimeIndex(pm10_tmp.index))
 
-    save_txt(instr, pm10)
+    tls.save_txt(instr, pm10)
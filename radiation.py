@@ -23,13 +23,14 @@ __lastupdate__ = "October 2024"
 
 import datetime as dt
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 import julian
 import numpy as np
 import pandas as pd
-import xarray as xr
 
 import thaao_settings as ts
+import tools as tls
 
 instr = 'rad'
 tm_res = '5min'
@@ -42,9 +43,35 @@ variables_rad = {'SW' : {'name': 'SW', 'uom': '[Wm-2]'}, 'LW': {'name': 'LW', 'u
 
 variables_alb = {'ALBEDO_SW': {'name': 'ALBEDO_SW', 'uom': '[unitless]'}, 'SW_UP': {'name': 'SW_UP', 'uom': '[Wm-2]'}}
 
+# variable of the yearly files -> instrument of the availability list
+rad_masks = {'LW'  : 'rad_down_lw', 'SW': 'rad_down_sw', 'LW_UP': 'rad_up_lw', 'TB': 'rad_tb', 'PAR_UP': 'rad_par_up',
+             'PAR_DOWN': 'rad_par_down'}
+alb_masks = {'ALB': 'rad_up_sw'}
+
+legacy_pattern = '%Y-%m-%d.globirr.thule.txt'  # DMI legacy DSI, one file per day
+legacy_start = dt.datetime(2000, 1, 1)
+legacy_end = dt.datetime(2011, 12, 31)
+legacy_content = False  # True: parse the legacy files for the sub-daily coverage (otherwise one sample per day)
+
 folder = os.path.join(ts.basefolder, "thaao_" + instr)
 
 
+def jd_to_datetime(jd):
+    """
+    Vectorized version of julian.from_jd(jd, fmt='jd').replace(microsecond=0): same Fliegel and van Flandern
+    split of day number and day fraction, same truncation to microseconds, then to seconds.
+    :param jd: array of Julian dates
+    :return: DatetimeIndex
+    """
+    jd = np.asarray(jd, dtype=float)
+    day = np.floor(jd + 0.5)
+    us = np.floor((jd + 0.5 - day) * (1e6 * 24 * 3600)).astype('int64')
+    us -= us % 1000000
+    # Julian day number 2440588 starts at 1970-01-01 00:00
+    return pd.DatetimeIndex(((day.astype('int64') - 2440588) * 86400000000 + us).astype('datetime64[us]'),
+                            name='datetime')
+
+
 def read_rad(folder, date_f):
     """
     Function for reading radiation data and formatting data strings.
@@ -55,15 +82,9 @@ def read_rad(folder, date_f):
 
     print('Reading RADIATION data for year ', date_f.strftime('%Y'))
     file_rad = os.path.join(folder, 'IRR_' + date_f.strftime('%y') + '001_' + date_f.strftime('%y') + '365_FIN.DAT')
-    rad = pd.read_table(file_rad, skiprows=None, header=0, decimal='.', delim_whitespace=True)
-
-    tmp = np.empty(rad['JDAY_ASS'].shape, dtype=dt.datetime)
-    for ii, el in enumerate(rad['JDAY_ASS']):
-        tmp[ii] = julian.from_jd(el, fmt='jd')
-        tmp[ii].replace(microsecond=0)
+    rad = pd.read_table(file_rad, skiprows=None, header=0, decimal='.', sep=r'\s+')
 
-    rad.index = pd.DatetimeIndex(tmp)
-    rad.index.name = 'datetime'
+    rad.index = jd_to_datetime(rad['JDAY_ASS'].values)
 
     data = rad.drop(['JDAY_ASS', 'YEAR_FR', 'JDAY_UT', 'TIME_UT', 'JDAY_LOC', 'TIME_LOC'], axis=1)
 
@@ -80,21 +101,92 @@ def read_alb(folder, date_f):
 
     print('Reading ALBEDO data for year ', date_f.strftime('%Y'))
     file_rad = os.path.join(folder, 'ALBEDO_SW_' + date_f.strftime('%Y') + '_5MIN.DAT')
-    alb = pd.read_table(file_rad, skiprows=None, header=0, decimal='.', delim_whitespace=True)
-    tmp = np.empty(alb['JDAY_UT'].shape, dtype=dt.datetime)
-    for ii, el in enumerate(alb['JDAY_UT']):
-        new_jd_ass = el + julian.to_jd(dt.datetime(int(date_f.strftime('%Y')) - 1, 12, 31, 0, 0), fmt='jd')
-        tmp[ii] = julian.from_jd(new_jd_ass, fmt='jd')
-        tmp[ii] = tmp[ii].replace(microsecond=0)
-
-    alb.index = pd.DatetimeIndex(tmp)
-    alb.index.name = 'datetime'
+    alb = pd.read_table(file_rad, skiprows=None, header=0, decimal='.', sep=r'\s+')
+    jd_0 = julian.to_jd(dt.datetime(int(date_f.strftime('%Y')) - 1, 12, 31, 0, 0), fmt='jd')
+    alb.index = jd_to_datetime(alb['JDAY_UT'].values + jd_0)
 
     data = alb.drop(['JDAY_UT', 'JDAY_LOC', 'SZA', 'SW_DOWN'], axis=1)
 
     return data
 
 
+def read_years(reader, folder, year_ls, label):
+    """
+    Reads the yearly files of a radiation product in parallel processes (parsing is CPU bound) and joins them
+    with a single concat.
+    :param reader: read_rad or read_alb
+    :param folder: input folder where to find data
+    :param year_ls: list of years
+    :param label: name of the product, for messages
+    :return: DataFrame of all the available years, sorted by time
+    """
+    data = []
+    with ProcessPoolExecutor(max_workers=ts.scan_workers) as executor:
+        futures = {executor.submit(reader, folder, dt.datetime(int(yr), 1, 1)): yr for yr in year_ls}
+        for future in as_completed(futures):
+            try:
+                data.append(future.result())
+            except FileNotFoundError:
+                print("file " + label + " " + str(futures[future]) + " not available")
+    if not data:
+        return pd.DataFrame()
+    return pd.concat(data).sort_index()
+
+
+def read_hourly(fn):
+    """
+    Reads an hourly radiation file (date, time, value) as typed data.
+    :param fn: path of the file
+    :return: DataFrame indexed by datetime, with a float column 'rad'
+    """
+    rad = pd.read_table(fn, comment='#', sep=r'\s+', usecols=[0, 1, 2], names=['date', 'time', 'rad'], header=0,
+                        dtype=str)
+    return pd.DataFrame({'rad': pd.to_numeric(rad['rad'], errors='coerce').values},
+                        index=pd.DatetimeIndex(pd.to_datetime(rad['date'] + ' ' + rad['time']), name='datetime'))
+
+
+def dsi_legacy_files(fol):
+    """
+    Lists the legacy DSI folder once and takes the days from the names of the files (YYYY-MM-DD.globirr.thule.txt).
+    :param fol: rad_dsi_legacy folder
+    :return: Series of file paths indexed by day, sorted, restricted to the legacy period
+    """
+    index = tls.dir_index(fol, legacy_pattern)
+    # digits in the right place but not a date (e.g. 2005-13-01.globirr.thule.txt) are skipped
+    days = pd.to_datetime(list(index.keys()), format=tls.pattern_to_regex(legacy_pattern)[1], errors='coerce')
+    files = pd.Series([fns[0] for fns in index.values()], index=days, dtype=object)
+    files = files[files.index.notna()].sort_index()
+    return files[legacy_start:legacy_end]
+
+
+def read_dsi_legacy(fn, day):
+    """
+    Reads the content of a legacy DSI file: time of the day (HH:MM[:SS]) in the first column, irradiance in the
+    second.
+    :param fn: path of the file
+    :param day: day of the file
+    :return: DataFrame indexed by datetime, with a float column 'rad'
+    """
+    rad = pd.read_table(fn, comment='#', sep=r'\s+', usecols=[0, 1], names=['time', 'rad'], header=None, dtype=str)
+    times = pd.to_timedelta(rad['time'].where(rad['time'].str.count(':') == 2, rad['time'] + ':00'), errors='coerce')
+    rad = pd.DataFrame({'rad': pd.to_numeric(rad['rad'], errors='coerce').values},
+                       index=pd.DatetimeIndex(day + times, name='datetime'))
+    return rad[rad.index.notnull()]
+
+
+def read_dsi_legacy_all(files):
+    """
+    Reads the content of all the legacy DSI files in parallel, for the sub-daily coverage.
+    :param files: Series of file paths indexed by day (from dsi_legacy_files)
+    :return: DataFrame indexed by datetime, sorted, with a float column 'rad'
+    """
+    if files.empty:
+        return pd.DataFrame({'rad': np.array([], dtype=float)}, index=pd.DatetimeIndex([], name='datetime'))
+    with ThreadPoolExecutor(max_workers=ts.scan_workers) as executor:
+        data = list(executor.map(read_dsi_legacy, files.values, files.index))
+    return pd.concat(data).sort_index()
+
+
 if __name__ == "__main__":
 
     year_ls = [2016, 2017, 2018, 2019, 2020, 2021, 2022, 2023]
@@ -102,68 +194,37 @@ if __name__ == "__main__":
     fn_rad_nc = 'radiation_stats_RAD_' + str(tm_res) + '_' + str(year_ls[0]) + '_' + str(year_ls[-1]) + '.nc'
     fn_alb_nc = 'radiation_stats_ALB_' + str(tm_res) + '_' + str(year_ls[0]) + '_' + str(year_ls[-1]) + '.nc'
 
-    tmp_rad = 0
-    data_rad = xr.DataArray()
-    for yr in year_ls:
-        start = dt.datetime(int(yr), 1, 1)
-        try:
-            data_rad_tmp = read_rad(folder, start)
-            data_rad = xr.concat([data_rad, data_rad], dim='datetime')
-        except FileNotFoundError:
-            data_rad_res = None
-            print("file radiation " + str(yr) + " not available")
-
-    ts.save_mask_txt(data_rad.to_dataframe()['LW'], 'rad_down_lw')
-    ts.save_mask_txt(data_rad.to_dataframe()['SW'], 'rad_down_sw')
-    ts.save_mask_txt(data_rad.to_dataframe()['LW_UP'], 'rad_up_lw')
-    ts.save_mask_txt(data_rad.to_dataframe()['TB'], 'rad_tb')
-    ts.save_mask_txt(data_rad.to_dataframe()['PAR_UP'], 'rad_par_up')
-    ts.save_mask_txt(data_rad.to_dataframe()['PAR_DOWN'], 'rad_par_down')
-
-    tmp_alb = 0
-    data_alb = xr.DataArray()
-    for yr in year_ls:
-        start = dt.datetime(int(yr), 1, 1)
-        try:
-            data_alb_tmp = read_alb(folder, start)
-            data_alb = xr.concat([data_alb, data_alb_tmp], dim='datetime')
-        except FileNotFoundError:
-            data_alb_res = None
-            print("file albedo " + str(yr) + " not available")
-
-    ts.save_mask_txt(data_alb.to_dataframe()['ALB'], 'rad_up_sw')
+    # one frame per product, all the masks are derived from it
+    data_rad = read_years(read_rad, folder, year_ls, 'radiation')
+    if not data_rad.empty:
+        for var, instr_nm in rad_masks.items():
+            tls.save_mask_txt(data_rad[[var]], instr_nm)
+
+    data_alb = read_years(read_alb, folder, year_ls, 'albedo')
+    if not data_alb.empty:
+        for var, instr_nm in alb_masks.items():
+            tls.save_mask_txt(data_alb[[var]], instr_nm)
 
     # old rad radiation data DMI availability
     fol_input_rad_old = os.path.join(folder, 'rad_dsi_legacy')
-    date_list = pd.date_range(dt.datetime(2000, 1, 1), dt.datetime(2011, 12, 31), freq='D').tolist()
-    rad_dsi_legacy = pd.DataFrame(columns=['dt', 'mask'])
-    for i in date_list:
-        fn = os.path.join(fol_input_rad_old, i.strftime('%Y-%m-%d') + '.globirr.thule.txt')
-        if os.path.exists(fn):
-            rad_dsi_legacy.loc[i] = [i, True]
+    legacy_files = dsi_legacy_files(fol_input_rad_old)
+    rad_dsi_legacy = tls.avail_df(legacy_files.index)
     np.savetxt(
             os.path.join(fol_input_rad_old, 'rad_dsi_legacy' + '_data_avail_list.txt'), rad_dsi_legacy, fmt='%s')
+    if legacy_content:
+        dsi_legacy = read_dsi_legacy_all(legacy_files)
+    else:
+        # one sample per day with a file
+        dsi_legacy = pd.DataFrame({'rad': np.ones(len(legacy_files))}, index=legacy_files.index.rename('datetime'))
 
     fol_input_rad = os.path.join(folder, 'rad_hourly')
-    uli = pd.read_table(
-            os.path.join(fol_input_rad, 'ULI.txt'), comment='#', delim_whitespace=True, usecols=[0, 1, 2],
-            parse_dates={'datetime': [0, 1]}, names=['date', 'time', 'rad'], header=0, index_col='datetime')
-    dli = pd.read_table(
-            os.path.join(fol_input_rad, 'DLI.txt'), comment='#', delim_whitespace=True, usecols=[0, 1, 2],
-            parse_dates={'datetime': [0, 1]}, names=['date', 'time', 'rad'], header=0, index_col='datetime')
-    usi = pd.read_table(
-            os.path.join(fol_input_rad, 'USI.txt'), comment='#', delim_whitespace=True, usecols=[0, 1, 2],
-            parse_dates={'datetime': [0, 1]}, names=['date', 'time', 'rad'], header=0, index_col='datetime')
-    dsi = pd.read_table(
-            os.path.join(fol_input_rad, 'DSI.txt'), comment='#', delim_whitespace=True, usecols=[0, 1, 2],
-            parse_dates={'datetime': [0, 1]}, names=['date', 'time', 'rad'], header=0, index_col='datetime')
-    rad_dsi_legacy.columns = ['datetime', 'rad']
-    rad_dsi_legacy = rad_dsi_legacy.set_index('datetime')
-    rad_dsi_legacy = rad_dsi_legacy * 1  # setting a value
-    dsi_all = pd.concat([dsi, rad_dsi_legacy])
-    dsi_all.sort_index()
-
-    ts.save_mask_txt(usi, 'rad_usi')
-    ts.save_mask_txt(uli, 'rad_uli')
-    ts.save_mask_txt(dli, 'rad_dli')
-    ts.save_mask_txt(dsi_all, 'rad_dsi')
+    uli = read_hourly(os.path.join(fol_input_rad, 'ULI.txt'))
+    dli = read_hourly(os.path.join(fol_input_rad, 'DLI.txt'))
+    usi = read_hourly(os.path.join(fol_input_rad, 'USI.txt'))
+    dsi = read_hourly(os.path.join(fol_input_rad, 'DSI.txt'))
+    dsi_all = pd.concat([dsi_legacy, dsi]).sort_index()
+
+    tls.save_mask_txt(usi, 'rad_usi')
+    tls.save_mask_txt(uli, 'rad_uli')
+    tls.save_mask_txt(dli, 'rad_dli')
+    tls.save_mask_txt(dsi_all, 'rad_dsi')
@@ -0,0 +1,129 @@
+#!/usr/local/bin/python3
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+#
+"""
+Runs all the instrument scanners listed in thaao_settings.instr_list at the same time.
+"""
+
+# =============================================================
+# CREATED:
+# AFFILIATION: INGV
+# AUTHORS: Filippo Cali' Quaglia
+# =============================================================
+#
+# -------------------------------------------------------------------------------
+__author__ = "Filippo Cali' Quaglia"
+__credits__ = ["??????"]
+__license__ = "GPL"
+__version__ = "0.1"
+__email__ = "filippo.caliquaglia@ingv.it"
+__status__ = "Research"
+__lastupdate__ = "October 2024"
+
+import argparse
+import datetime as dt
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import catalog as cat
+import thaao_settings as ts
+
+script_folder = os.path.dirname(os.path.abspath(__file__))
+
+
+def select_scripts(i_list):
+    """
+    Scanner scripts to be launched for a list of instruments. Scripts producing more than one instrument (e.g.
+    radiation.py, macmap_seismometer.py) are launched only once, and all the instruments of ts.instr_registry are
+    scanned by a single scan_engine.py run (one walk of the basefolder).
+    :param i_list: list of instrument names (as in ts.instr_list)
+    :return: list of (script name, arguments), list of instruments without a scanner
+    """
+    scripts = []
+    engine = []
+    missing = []
+    for i_name in i_list:
+        script = ts.instr_scripts.get(i_name)
+        if i_name in ts.instr_registry:
+            engine.append(i_name)
+        elif script is None:
+            missing.append(i_name)
+        elif (script, []) not in scripts:
+            scripts.append((script, []))
+    if engine:
+        scripts.insert(0, ('scan_engine.py', engine))
+    return scripts, missing
+
+
+def run_script(script, timeout=None, args=()):
+    """
+    Runs a scanner script in its own process, so that a failing instrument does not stop the others.
+    :param script: script name (in the same folder of this file)
+    :param timeout: seconds after which the scanner is killed (None: no limit)
+    :param args: command line arguments of the script
+    :return: script name, return code (None if killed by timeout), elapsed time, stderr of the scanner
+    """
+    start = dt.datetime.now()
+    try:
+        res = subprocess.run(
+                [sys.executable, os.path.join(script_folder, script), *args], cwd=script_folder, capture_output=True,
+                text=True, timeout=timeout)
+        return script, res.returncode, dt.datetime.now() - start, res.stderr
+    except subprocess.TimeoutExpired:
+        return script, None, dt.datetime.now() - start, f'killed after {timeout} s'
+
+
+def scan_all(i_list, workers=ts.scan_workers, timeout=ts.scan_timeout):
+    """
+    Runs the scanners of the instruments in i_list concurrently, at most workers at a time.
+    :param i_list: list of instrument names
+    :param workers: maximum number of scanners running at the same time
+    :param timeout: seconds after which a single scanner is killed (None: no limit)
+    :return: dict {script: return code}
+    """
+    scripts, missing = select_scripts(i_list)
+    for i_name in missing:
+        print('no scanner for ' + i_name)
+
+    if ts.use_catalog:
+        # the snapshot of the basefolder is refreshed once here and then only queried by the scanners
+        cat.refresh()
+        os.environ['THAAO_CATALOG_FRESH'] = '1'
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_script, script, timeout, args) for script, args in scripts]
+        for future in as_completed(futures):
+            script, ret, elapsed, err = future.result()
+            results[script] = ret
+            if ret == 0:
+                print(f'{script}: done in {elapsed}')
+            else:
+                print(f'{script}: FAILED ({ret}) after {elapsed}')
+                print(err.strip().splitlines()[-1] if err.strip() else '')
+
+    failed = [script for script, ret in results.items() if ret != 0]
+    print(f'{len(scripts) - len(failed)}/{len(scripts)} scanners completed')
+    if failed:
+        print('failed: ' + ', '.join(sorted(failed)))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the THAAO data availability scanners concurrently.')
+    parser.add_argument('instr', nargs='*', default=ts.instr_list, help='instruments to scan (default: all)')
+    parser.add_argument('-w', '--workers', type=int, default=ts.scan_workers, help='scanners running at once')
+    parser.add_argument('-t', '--timeout', type=float, default=ts.scan_timeout, help='timeout per scanner [s]')
+    parser.add_argument('--full', action='store_true', help='rebuild the lists from scratch (no incremental scan)')
+    args = parser.parse_args()
+    if args.full:
+        # thaao_settings is already imported here: the catalog refresh of this process reads the setting, the
+        # scanners inherit the environment variable
+        ts.scan_full_rebuild = True
+        os.environ['THAAO_FULL_REBUILD'] = '1'
+
+    res = scan_all(args.instr, workers=args.workers, timeout=args.timeout)
+    sys.exit(0 if all(ret == 0 for ret in res.values()) else 1)
@@ -0,0 +1,203 @@
+#!/usr/local/bin/python3
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+#
+"""
+Scans all the instruments described in thaao_settings.instr_registry with a single walk of the basefolder.
+"""
+
+# =============================================================
+# CREATED:
+# AFFILIATION: INGV
+# AUTHORS: Filippo Cali' Quaglia
+# =============================================================
+#
+# -------------------------------------------------------------------------------
+__author__ = "Filippo Cali' Quaglia"
+__credits__ = ["??????"]
+__license__ = "GPL"
+__version__ = "0.1"
+__email__ = "filippo.caliquaglia@ingv.it"
+__status__ = "Research"
+__lastupdate__ = "October 2024"
+
+import argparse
+import os
+import re
+from collections import defaultdict
+
+import pandas as pd
+
+import thaao_settings as ts
+import tools as tls
+
+
+def instr_folder(instr_nm):
+    """
+    :param instr_nm: instrument name (key of ts.instr_registry)
+    :return: data folder of the instrument
+    """
+    return os.path.join(ts.basefolder, ts.instr_registry[instr_nm].get('folder', 'thaao_' + instr_nm))
+
+
+def instr_dates(instr_nm):
+    """
+    :param instr_nm: instrument name
+    :return: list of the dates to be checked for the instrument (start_instr to end_instr, at its cadence)
+    """
+    return pd.date_range(ts.instr_metadata[instr_nm]['start_instr'], ts.instr_metadata[instr_nm]['end_instr'],
+                         freq=ts.instr_registry[instr_nm].get('cadence', 'D')).tolist()
+
+
+def pattern_depth(instr_nm):
+    """
+    :param instr_nm: instrument name
+    :return: number of path components of the files of the instrument below the basefolder
+    """
+    cfg = ts.instr_registry[instr_nm]
+    rel = os.path.relpath(instr_folder(instr_nm), ts.basefolder)
+    return len(re.split(r'[\\/]', rel)) + (len(re.split(r'[\\/]', cfg['pattern'])) if 'pattern' in cfg else 0)
+
+
+def walk_basefolder(i_list):
+    """
+    Lists the basefolder once, descending only into the folders of the instruments, down to the depth of their
+    patterns, and dispatches the files to the instruments.
+    :param i_list: list of instrument names
+    :return: dict {instrument: list of (path, size, mtime) of the files in its folder}
+    """
+    folders = {instr_nm: instr_folder(instr_nm) for instr_nm in i_list}
+    depths = {}
+    for instr_nm, fol in folders.items():
+        depths[fol] = max(depths.get(fol, 0), pattern_depth(instr_nm))
+
+    def select(path, depth):
+        # a sub-directory is listed if it is (or is inside, or leads to) an instrument folder deep enough
+        return any((path == fol) | fol.startswith(path + os.sep) | (path.startswith(fol + os.sep) & (depth < d)) for
+                   fol, d in depths.items())
+
+    entries = defaultdict(list)
+    max_depth = max(depths.values(), default=1) - 1
+    for entry in tls.walk_tree(ts.basefolder, max_depth=max_depth, select=select):
+        for instr_nm, fol in folders.items():
+            if entry[0].startswith(fol + os.sep):
+                entries[instr_nm].append(entry)
+    return entries
+
+
+def name_date(name, part):
+    """
+    :param name: name of a file or folder matching a pattern component
+    :param part: (compiled regex, date directives) of the component, as returned by tls.pattern_to_regex
+    :return: date in the name (NaT if the digits are not a valid date, e.g. th991399.dat)
+    """
+    return pd.to_datetime(''.join(part[0].match(name).groups()), format=part[1], errors='coerce')
+
+
+def scan_dirs(instr_nm, fn_index):
+    """
+    Directories to be checked by tls.scan_period, with the first date each of them covers. Sub-folders named after
+    their period (e.g. '%Y/', '%Y%m_...') are rescanned from the beginning of the period, as well as all the folders
+    of historical archives; flat folders holding the newest files are rescanned only for the last ts.scan_lookback
+    days, the others from their oldest file.
+    :param instr_nm: instrument name
+    :param fn_index: dict {date_key: [file paths]} of the instrument
+    :return: dict {directory: first date (or None)}
+    """
+    cfg = ts.instr_registry[instr_nm]
+    parts = [tls.pattern_to_regex(part) for part in re.split(r'[\\/]', cfg['pattern'])]
+    first = {}
+    last = {}
+    for fns in fn_index.values():
+        for fn in fns:
+            date = name_date(os.path.basename(fn), parts[-1])
+            if pd.isna(date):
+                continue
+            fol = os.path.dirname(fn)
+            first[fol] = min(first.get(fol, date), date)
+            last[fol] = max(last.get(fol, date), date)
+    newest = max(last.values(), default=None)
+    dated = (len(parts) > 1) and (parts[-2][1] != '')  # files in sub-folders named after their period
+    dirs = {instr_folder(instr_nm): instr_dates(instr_nm)[0] if cfg.get('historical') else None}
+    for fol in first:
+        if dated:
+            start = name_date(os.path.basename(fol), parts[-2])
+            dirs[fol] = min(first[fol], start).to_pydatetime() if not pd.isna(start) else first[fol].to_pydatetime()
+        elif (last[fol] == newest) & (not cfg.get('historical')):
+            dirs[fol] = None
+        else:
+            dirs[fol] = first[fol].to_pydatetime()
+    return dirs
+
+
+def scan_instrument(instr_nm, entries, since=None):
+    """
+    Availability of one instrument of the registry from the listing of its folder, written (incrementally) with
+    the tools of the scanner scripts.
+    :param instr_nm: instrument name
+    :param entries: list of (path, size, mtime) of the files in the folder of the instrument
+    :param since: first date known to have new files, rescanned in any case (see tls.scan_period)
+    :return:
+    """
+    cfg = ts.instr_registry[instr_nm]
+    kind = cfg.get('kind', 'files')
+    date_list = instr_dates(instr_nm)
+
+    if kind == 'estimate':
+        scan_dates, append_from, scan_state = tls.scan_period(instr_nm, date_list, [])
+        tls.save_txt(instr_nm, tls.avail_df(scan_dates), append_from=append_from)
+        tls.save_scan_state(instr_nm, scan_state)
+        return
+
+    pattern = cfg['pattern']
+    fn_index = tls.tree_index(instr_folder(instr_nm), pattern, entries=entries)
+    if kind == 'zip':
+        # an archive growing in place does not change the mtime of its folder: the archives indexed again restart
+        # the scan from their first day
+        fns = [fn for fns in fn_index.values() for fn in fns]
+        zip_members, stale = tls.zip_index(instr_nm, fns)
+        part = tls.pattern_to_regex(re.split(r'[\\/]', pattern)[-1])
+        stale_dates = [i for i in (name_date(os.path.basename(fn), part) for fn in stale) if not pd.isna(i)]
+        if stale_dates:
+            since = min(stale_dates + ([pd.Timestamp(since)] if since is not None else [])).to_pydatetime()
+    scan_dates, append_from, scan_state = tls.scan_period(instr_nm, date_list, scan_dirs(instr_nm, fn_index), since)
+    keys = [tls.date_key(i, pattern) for i in scan_dates]
+
+    if kind == 'files':
+        tls.save_txt(instr_nm, tls.avail_df(scan_dates, [key in fn_index for key in keys]), append_from=append_from)
+    elif kind == 'zip':
+        members = [x for names in zip_members.values() for x in names]
+        found = pd.DatetimeIndex(scan_dates).isin(tls.member_times(members, cfg['members']))
+        tls.save_txt(instr_nm, tls.avail_df(scan_dates, found), append_from=append_from)
+    elif kind == 'netcdf':
+        fns = [fn for key in keys for fn in fn_index.get(key, [])]
+        tls.save_mask_txt(tls.nc_coverage(fns, scan_dates, cfg['coverage']), instr_nm, append_from=append_from)
+    else:
+        raise ValueError(f'{instr_nm}: unknown kind {kind}')
+    tls.save_scan_state(instr_nm, scan_state)
+    return
+
+
+def scan(i_list=None):
+    """
+    Scans the instruments of the registry with a single walk of the basefolder.
+    :param i_list: instrument names (None: all the instruments in ts.instr_registry)
+    :return: list of the instruments whose scan failed
+    """
+    i_list = [i for i in (i_list or ts.instr_registry) if i in ts.instr_registry]
+    entries = walk_basefolder([i for i in i_list if 'pattern' in ts.instr_registry[i]])
+    failed = []
+    for instr_nm in i_list:
+        try:
+            scan_instrument(instr_nm, entries.get(instr_nm, []))
+        except Exception as e:  # one instrument does not stop the others
+            print(f'{instr_nm}: FAILED ({e})')
+            failed.append(instr_nm)
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Scan the instruments of thaao_settings.instr_registry.')
+    parser.add_argument('instr', nargs='*', help='instruments to scan (default: all in the registry)')
+    args = parser.parse_args()
+    raise SystemExit(1 if scan(args.instr) else 0)
@@ -21,31 +21,129 @@ __email__ = "filippo.caliquaglia@ingv.it"
 __status__ = "Research"
 __lastupdate__ = "October 2024"
 
+import asyncio
+import datetime as dt
+import http.client
 import os
-import urllib.request
+import urllib.parse
 
+import numpy as np
 import pandas as pd
 
 import thaao_settings as ts
+import tools as tls
 
 instr = 'skycam'
 date_list = pd.date_range(
         ts.instr_metadata[instr]['start_instr'], ts.instr_metadata[instr]['end_instr'], freq='D').tolist()
 folder = os.path.join(ts.basefolder, "thaao_" + instr)
+base_url = "https://www.thuleatmos-it.it/data/skythule/data/"
+
+max_in_flight = 16  # maximum number of requests at the same time (= kept-alive connections)
+n_retries = 3  # retries of a request after a transient error
+backoff = 1.  # seconds before the first retry, doubled at each retry
+timeout = 30  # seconds
+
+
+def image_path(i):
+    """
+    :param i: datetime
+    :return: path (relative to base_url) of the skycam image taken at i
+    """
+    return i.strftime('%Y/%Y%m%d/THULE_IMAGE_%Y%m%d_') + i.strftime('%H%M') + ".jpg"
+
+
+def new_connection(url):
+    """
+    :param url: base url of the images
+    :return: http(s) connection to the host of url (kept alive between requests)
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme == 'https':
+        return http.client.HTTPSConnection(parts.netloc, timeout=timeout)
+    return http.client.HTTPConnection(parts.netloc, timeout=timeout)
+
+
+def head_request(conn, path):
+    """
+    Checks if a file exists on the server without downloading it: HEAD request, or a GET of its first byte if
+    HEAD is not allowed.
+    :param conn: http(s) connection
+    :param path: absolute path on the server
+    :return: True if the file exists, False if not found
+    """
+    conn.request('HEAD', path)
+    res = conn.getresponse()
+    res.read()
+    if res.status == 405:
+        conn.request('GET', path, headers={'Range': 'bytes=0-0'})
+        res = conn.getresponse()
+        res.read()
+    if res.status in (200, 206):
+        return True
+    if (res.status == 404) | (res.status == 403) | (res.status == 410):
+        return False
+    raise ConnectionError(f'HTTP {res.status} for {path}')  # e.g. 5xx: retried
+
+
+async def probe(pool, url, path):
+    """
+    Checks a file with a connection taken from the pool, retrying with exponential backoff on transient errors.
+    :param pool: asyncio.Queue of connections (its size caps the requests in flight)
+    :param url: base url of the images
+    :param path: path of the file relative to url
+    :return: True if the file exists, False if not found, None if unknown (all the retries have failed)
+    """
+    full_path = urllib.parse.urlsplit(url).path + path
+    conn = await pool.get()
+    try:
+        for attempt in range(n_retries + 1):
+            try:
+                return await asyncio.to_thread(head_request, conn, full_path)
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()  # reconnects at the next request
+                if attempt == n_retries:
+                    print(f'{path}: {e}')
+                    return None
+                await asyncio.sleep(backoff * 2 ** attempt)
+    finally:
+        pool.put_nowait(conn)
+
+
+async def probe_all(url, paths, n_conn=max_in_flight):
+    """
+    Checks a list of files concurrently, with at most n_conn requests in flight on n_conn kept-alive connections.
+    :param url: base url of the images
+    :param paths: paths of the files relative to url
+    :param n_conn: number of connections
+    :return: list of True/False/None (file exists, not found, unknown), same order of paths
+    """
+    pool = asyncio.Queue()
+    for _ in range(n_conn):
+        pool.put_nowait(new_connection(url))
+    try:
+        return await asyncio.gather(*[probe(pool, url, path) for path in paths])
+    finally:
+        while not pool.empty():
+            pool.get_nowait().close()
+
 
 if __name__ == "__main__":
 
-    skycam = pd.DataFrame(columns=['dt', 'mask'])
-    for i in date_list:
-        imgURL = "https://www.thuleatmos-it.it/data/skythule/data/" + i.strftime(
-                '%Y/%Y%m%d/THULE_IMAGE_%Y%m%d_') + i.strftime('%H%M') + ".jpg"
-        try:
-            urllib.request.urlopen(imgURL)
-            skycam.loc[i] = [i, True]
-            print(i)
-        except urllib.request.HTTPError as e:
-            pass
-        except urllib.request.URLError as e:
-            pass
-
-    ts.save_txt(instr, skycam)
+    # a remote source has no directory mtimes: the last ts.scan_lookback days of the previous run are checked
+    # again, as their images may have been uploaded since
+    last = tls.load_scan_state(instr)
+    since = (last['last_date'] - dt.timedelta(days=ts.scan_lookback)) if last is not None else None
+    scan_dates, append_from, scan_state = tls.scan_period(instr, date_list, [], since)
+    res = asyncio.run(probe_all(base_url, [image_path(i) for i in scan_dates]))
+    found = np.array([r is True for r in res], dtype=bool)
+    skycam = tls.avail_df(scan_dates, found)
+
+    tls.save_txt(instr, skycam, append_from=append_from)
+    unknown = [i for i, r in zip(scan_dates, res) if r is None]
+    if unknown:
+        # days not checked (server unreachable) are saved as missing, but the cursor stops before the first of
+        # them, so that the next run checks them again
+        print(f'{instr}: {len(unknown)} days not checked, rescanned from {unknown[0]:%Y-%m-%d} at the next run')
+        scan_state['last_date'] = unknown[0] - dt.timedelta(days=1)
+    tls.save_scan_state(instr, scan_state)
@@ -0,0 +1,74 @@
+#!/usr/local/bin/python3
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+#
+"""
+Covered fractions of the availability pyramid: exact, with empty bins at 0.
+"""
+
+# =============================================================
+# CREATED:
+# AFFILIATION: INGV
+# AUTHORS: Filippo Cali' Quaglia
+# =============================================================
+#
+# -------------------------------------------------------------------------------
+__author__ = "Filippo Cali' Quaglia"
+__credits__ = ["??????"]
+__license__ = "GPL"
+__version__ = "0.1"
+__email__ = "filippo.caliquaglia@ingv.it"
+__status__ = "Research"
+__lastupdate__ = "October 2024"
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import avail_store as avs
+
+
+def reference(starts, ends, edges):
+    """
+    :return: covered time in each bin [ns], interval by interval and bin by bin
+    """
+    t = edges.astype('datetime64[ns]').astype(np.int64)
+    out = np.zeros(len(t) - 1, dtype=np.int64)
+    for a, b in zip(starts.astype(np.int64), ends.astype(np.int64)):
+        for j in range(max(np.searchsorted(t, a, 'right') - 1, 0), min(np.searchsorted(t, b, 'left'), len(t) - 1)):
+            out[j] += min(b, t[j + 1]) - max(a, t[j])
+    return out
+
+
+def sonde_intervals():
+    # 2000 random sonde days over 1973-2026, each covering its whole day
+    rng = np.random.default_rng(0)
+    days = np.sort(rng.choice(pd.date_range('1973-01-01', '2026-12-31').values, 2000, replace=False))
+    return avs.merge_intervals(days, days + np.timedelta64(1, 'D'))
+
+
+def test_covered_time_exact():
+    starts, ends = sonde_intervals()
+    for lev in ['12h', '1D']:
+        edges = pd.date_range(avs.bin_floor(starts[0], lev), pd.Timestamp(ends[-1]) + pd.Timedelta(lev), freq=lev)
+        covered = avs.covered_time(starts, ends, edges.values)
+        assert (covered == reference(starts, ends, edges.values)).all()
+
+
+def test_empty_bins_are_zero(tmp_path):
+    starts, ends = sonde_intervals()
+    pyramid = str(tmp_path / 'pyramid.npz')
+    # runs of valid daily samples: each covers [start, end + 1 day]
+    avs.save_pyramid(pyramid, pd.DataFrame({'start': starts, 'end': ends - np.timedelta64(1, 'D')}),
+                     pd.Timedelta('1D'), levels=['1h', '12h', '1D'])
+    with np.load(pyramid) as data:
+        for lev in ['1h', '12h', '1D']:
+            bins = data[f'{lev}_bins']
+            edges = np.r_[bins, bins[-1] + np.timedelta64(pd.Timedelta(lev))]
+            empty = reference(starts, ends, edges) == 0
+            assert (data[f'{lev}_frac'][empty] == 0).all()
+            assert (data[f'{lev}_frac'][~empty] > 0).all()
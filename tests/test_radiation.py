@@ -0,0 +1,55 @@
+#!/usr/local/bin/python3
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+#
+"""
+Parity of the vectorized Julian date conversion of radiation.py with the julian package.
+"""
+
+# =============================================================
+# CREATED:
+# AFFILIATION: INGV
+# AUTHORS: Filippo Cali' Quaglia
+# =============================================================
+#
+# -------------------------------------------------------------------------------
+__author__ = "Filippo Cali' Quaglia"
+__credits__ = ["??????"]
+__license__ = "GPL"
+__version__ = "0.1"
+__email__ = "filippo.caliquaglia@ingv.it"
+__status__ = "Research"
+__lastupdate__ = "October 2024"
+
+import os
+import sys
+
+import julian
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import radiation as rad
+
+
+def reference(jd):
+    """
+    :param jd: array of Julian dates
+    :return: DatetimeIndex from julian.from_jd, truncated to seconds as in read_rad/read_alb before vectorization
+    """
+    return pd.DatetimeIndex([julian.from_jd(i, fmt='jd').replace(microsecond=0) for i in jd])
+
+
+def test_jd_to_datetime_random():
+    # one year with the 5-minute sampling of the radiation files, and random times over 1990-2030
+    rng = np.random.default_rng(0)
+    jd = np.r_[2458849.5 + np.arange(0, 366, 5 / 1440), rng.uniform(2447892.5, 2462502.5, 50000)]
+    assert (rad.jd_to_datetime(jd) == reference(jd)).all()
+
+
+def test_jd_to_datetime_edges():
+    # midnight and noon (day boundary of the Julian date), and values just around them
+    jd = np.array([2451544.5, 2451545.0, 2460000.5, 2460000.0])
+    jd = np.r_[jd, np.nextafter(jd, 0), np.nextafter(jd, np.inf)]
+    assert (rad.jd_to_datetime(jd) == reference(jd)).all()
@@ -0,0 +1,104 @@
+#!/usr/local/bin/python3
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+#
+"""
+Concurrent skycam prober against a local stand-in HTTP server.
+"""
+
+# =============================================================
+# CREATED:
+# AFFILIATION: INGV
+# AUTHORS: Filippo Cali' Quaglia
+# =============================================================
+#
+# -------------------------------------------------------------------------------
+__author__ = "Filippo Cali' Quaglia"
+__credits__ = ["??????"]
+__license__ = "GPL"
+__version__ = "0.1"
+__email__ = "filippo.caliquaglia@ingv.it"
+__status__ = "Research"
+__lastupdate__ = "October 2024"
+
+import asyncio
+import os
+import socket
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import skycam
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """
+    /data/ok.jpg: 200; /data/missing.jpg: 404; /data/nohead.jpg: 405 to HEAD, 206 to a ranged GET;
+    /data/flaky.jpg: 503 the first time, then 200; /data/broken.jpg: always 503.
+    """
+    protocol_version = 'HTTP/1.1'  # kept-alive connections, as the real server
+    hits = {}
+
+    def reply(self, status, body=b''):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command == 'GET':
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        StandIn.hits[self.path] = StandIn.hits.get(self.path, 0) + 1
+        if self.path == '/data/ok.jpg':
+            self.reply(200)
+        elif self.path == '/data/nohead.jpg':
+            self.reply(405)
+        elif self.path == '/data/flaky.jpg':
+            self.reply(503 if StandIn.hits[self.path] == 1 else 200)
+        elif self.path == '/data/broken.jpg':
+            self.reply(503)
+        else:
+            self.reply(404)
+
+    def do_GET(self):
+        if (self.path == '/data/nohead.jpg') & (self.headers.get('Range') == 'bytes=0-0'):
+            self.reply(206, b'x')
+        else:
+            self.reply(404)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(skycam, 'backoff', 0.01)
+    StandIn.hits = {}
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}/data/'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_probe_all(server):
+    paths = ['ok.jpg', 'missing.jpg', 'nohead.jpg', 'flaky.jpg', 'broken.jpg']
+    assert asyncio.run(skycam.probe_all(server, paths, n_conn=2)) == [True, False, True, True, None]
+    assert StandIn.hits['/data/broken.jpg'] == skycam.n_retries + 1
+
+
+def test_probe_all_many(server):
+    paths = ['ok.jpg', 'missing.jpg'] * 50
+    assert asyncio.run(skycam.probe_all(server, paths, n_conn=4)) == [True, False] * 50
+
+
+def test_probe_all_refused(monkeypatch):
+    monkeypatch.setattr(skycam, 'backoff', 0.01)
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]  # closed when the block ends: nothing listens there
+    assert asyncio.run(skycam.probe_all(f'http://127.0.0.1:{port}/data/', ['ok.jpg'], n_conn=1)) == [None]
@@ -34,6 +34,94 @@ instr_list = ['uv-vis_spec', 'lidar_ae', 'o3_sondes', 'aero_sondes', 'rs_sondes'
               'macmap_seismometer_4', 'macmap_tide_gauge', 'rad_uli', 'rad_usi', 'rad_dli', 'rad_dsi', 'rad_tb',
               'rad_par_up', 'rad_par_down']
 
+# scanner script producing the availability list of each instrument not in instr_registry (used by scan_all.py)
+instr_scripts = {'wv_isotopes'         : 'vapour_isotopes.py', 'metar': 'metar.py', 'vespa': 'vespa.py',
+                 'hatpro'              : 'hatpro.py', 'dir_rad_trkr': 'dir_rad_trkr.py', 'pm10': 'pm10.py',
+                 'ftir'                : 'ftir.py', 'aeronet': 'aeronet.py', 'aws(p,T,RH)': 'meteo.py',
+                 'lidar_temp'          : 'lidar_temp.py', 'skycam': 'skycam.py',
+                 'macmap_seismometer_1': 'macmap_seismometer.py', 'macmap_seismometer_2': 'macmap_seismometer.py',
+                 'macmap_seismometer_3': 'macmap_seismometer.py', 'macmap_seismometer_4': 'macmap_seismometer.py',
+                 'macmap_tide_gauge'   : 'macmap_tide_gauge.py', 'rad_uli': 'radiation.py', 'rad_usi': 'radiation.py',
+                 'rad_dli'             : 'radiation.py', 'rad_dsi': 'radiation.py', 'rad_tb': 'radiation.py',
+                 'rad_par_up'          : 'radiation.py', 'rad_par_down': 'radiation.py'}
+
+# instruments scanned by scan_engine.py, described by data instead of a script of their own:
+# 'kind'       -> 'files': a day is available if a file matching 'pattern' exists
+#                 'zip': days from the names of the members (matching 'members') of the archives matching 'pattern'
+#                 'netcdf': sub-daily coverage (bins of 'coverage') from the time coordinate of the files
+#                 'estimate': no data to scan, every day of the instrument period is available
+# 'pattern'    -> file names relative to 'folder', with glob wildcards and strftime directives (as in tools.dir_index)
+# 'folder'     -> data folder, relative to basefolder (default: thaao_<instr>)
+# 'cadence'    -> frequency of the dates checked (default: 'D')
+# 'historical' -> a change in a folder rescans all the dates it covers (otherwise the last scan_lookback days only)
+instr_registry = {'o3_sondes'           : {'kind': 'files', 'pattern': 'th%y%m%d.*', 'historical': True},
+                  'aero_sondes'         : {'kind': 'files', 'pattern': 'th%y%m%d.*', 'historical': True},
+                  'gbms'                : {'kind': 'files', 'pattern': 'th*%y%m.*', 'historical': True},
+                  'uv-vis_spec'         : {'kind': 'files', 'pattern': 'thtc%y%m.erv', 'historical': True},
+                  'lidar_ae'            : {'kind'      : 'files', 'pattern': 'WWW-AIR_1685207569988/thae%y%m.*',
+                                           'historical': True},
+                  'rs_sondes'           : {'kind': 'files', 'pattern': '%Y/EDT_BGTL_%Y%m%d*'},
+                  'ecapac_aws_snow'     : {'kind': 'files', 'pattern': 'AWS_ECAPAC/AWS_THAAO_%Y_%m_%d_00_00.dat'},
+                  'ecapac_disdro_precip': {'kind': 'files', 'pattern': 'DISDRO/DISDRO_THAAO_%Y_%m_%d_00_00.dat'},
+                  'mms_trios'           : {'kind': 'zip', 'pattern': '%Y-%m.zip', 'members': '%Y-%m-%d/*'},
+                  'ceilometer'          : {'kind'    : 'netcdf',
+                                           'pattern' : '%Y%m_Thule_CHM190147.nc/%Y%m%d_Thule_CHM190147_*.nc',
+                                           'coverage': '30min'},
+                  'ecapac_mrr'          : {'kind'    : 'netcdf', 'pattern': 'mrr_improtoo_*_Thule_%Y%m%d.nc',
+                                           'coverage': '30min'},
+                  'gnss'                : {'kind': 'estimate'}}
+
+# folder of the availability outputs, when it is not thaao_<instr> (the per-species FTIR lists, ftir_<species>, are
+# added by ftir.py and written in thaao_ftir)
+avail_folders = {'aws(p,T,RH)': 'thaao_meteo'}
+
+# scan_all.py: number of scanners running at the same time and timeout (in s) of each of them (None: no timeout)
+scan_workers = 8
+scan_timeout = None
+
+# watch.py: 'inotify' (Linux, local disks), 'poll' (network mounts, where inotify does not see remote changes) or
+# 'auto' (inotify on local disks, polling if a folder is on a network mount); seconds between polls, seconds without
+# new events before the outputs are updated; scripts run when a file changes in a folder (relative to basefolder)
+# and scripts run periodically (every n s)
+watch_mode = 'auto'
+watch_poll = 60
+watch_debounce = 5
+watch_scripts = {os.path.join('thaao_meteo', 'weekly'): 'meteo.py'}
+watch_periodic = {'skycam.py': 3600}
+
+# local snapshot of the thaao_* folders (catalog.py): scanners list and check files there instead of on basefolder.
+# It is refreshed (only the directories whose mtime changed are listed again) when older than catalog_max_age [s]
+use_catalog = True
+catalog_file = os.path.join(os.path.expanduser('~'), '.thaao', 'thaao_catalog.sqlite')
+catalog_max_age = 0
+
+# incremental scans: days rescanned before the last scanned date when a data folder has changed, and full rebuild
+# of all the availability lists (also set by THAAO_FULL_REBUILD=1, e.g. from scan_all.py --full)
+scan_lookback = 3
+scan_full_rebuild = os.environ.get('THAAO_FULL_REBUILD', '') == '1'
+
+# availability outputs written by tools.save_txt/save_mask_txt next to the text lists ('txt' is always written):
+# 'bitset' -> <instr>_data_avail.bits, one bit per bitset_slot minutes, memory-mapped by plots.py
+# 'parquet' -> <instr>_data_avail.parquet, typed timestamps and mask, one row group per year (needs pyarrow)
+# 'intervals' -> <instr>_data_avail_intervals.txt, 'start end' runs of valid data with gaps up to interval_max_gap
+# 'pyramid' -> <instr>_data_avail_pyramid.npz, fraction of each bin covered by data at the pyramid_levels
+#  resolutions (also writes the intervals); plots.py uses the coarsest level with about one bin per pixel
+avail_formats = ['txt', 'bitset', 'intervals', 'pyramid']
+pyramid_levels = ['1h', '12h', '1D', '1MS']
+pyramid_min_fraction = 0.  # bins with a larger covered fraction are plotted as available
+bitset_slot = 720
+interval_max_gap = {'default'    : '1D', 'metar': '3h', 'vespa': '60min', 'hatpro': '60min', 'aws(p,T,RH)': '60min',
+                    'rad_uli'    : '60min', 'rad_usi': '60min', 'rad_dli': '60min', 'rad_dsi': '60min',
+                    'rad_tb'     : '60min', 'rad_par_up': '60min', 'rad_par_down': '60min', 'rad_down_lw': '60min',
+                    'rad_down_sw': '60min', 'rad_up_lw': '60min', 'rad_up_sw': '60min', 'ceilometer': '30min',
+                    'ecapac_mrr' : '30min'}
+
+# days with data not (yet) in the instrument listings, added on top of the scan: {instr: [(first day, last day)]}
+manual_avail = {'macmap_seismometer_1': [(dt.datetime(2023, 5, 5), dt.datetime(2023, 6, 3))],  # 2023 days 125-154
+                'macmap_seismometer_2': [(dt.datetime(2023, 4, 23), dt.datetime(2023, 4, 29))],  # 2023 days 113-119
+                'macmap_seismometer_3': [(dt.datetime(2023, 4, 20), dt.datetime(2023, 6, 3))],  # 2023 days 110-154
+                'macmap_seismometer_4': [(dt.datetime(2023, 4, 23), dt.datetime(2023, 6, 3))]}  # 2023 days 113-154
+
 # switches
 switch_campaigns = ''  # Draw field campaigns?
 switch_all = ''  # Plot full panels?
@@ -21,13 +21,25 @@ __email__ = "filippo.caliquaglia@gmail.com"
 __status__ = "Research"
 __lastupdate__ = ""
 
+import datetime as dt
+import json
 import os
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import numpy as np
 import pandas as pd
 
+import avail_store as avs
+import catalog as cat
 import thaao_settings as ts
 
+try:
+    import netCDF4
+except ImportError:  # needed only by the scanners reading NetCDF headers
+    netCDF4 = None
+
 
 def input_file_selection(i_idx, i_list, i_name):
     """
@@ -37,38 +49,485 @@ def input_file_selection(i_idx, i_list, i_name):
     :param i_name:
     :return:
     """
-    try:
-        print(f'{i_idx:02}' + ' ' + i_name)
-        # if i_name[0:3] == 'rad':
-        #     inp_file = os.path.join(fol_input, 'thaao_rad', i_name + '_data_avail_list.txt')
-        if i_name[0:3] == 'aws':
-            inp_file = os.path.join(ts.basefolder, 'thaao_meteo', i_name + '_data_avail_list.txt')
-        # elif i_name[0:5] == 'lidar':
-        #     inp_file = os.path.join(fol_input, 'thaao_lidar', i_name + '_data_avail_list.txt')
-        # elif i_name[0:5] == 'metar':
-        #     inp_file = os.path.join(fol_input, i_name + '_data_avail_list.txt')
-        # elif i_name[0:13] == 'macmap_seismometers':
-        #     inp_file = os.path.join(fol_input, 'thaao_macmap_seismometers', i_name + '_data_avail_list.txt')
-        # elif (i_name[0:11] == 'ecapac_snow') | (i_name[0:10] == 'ecapac_aws'):
-        #     inp_file = os.path.join(fol_input, 'thaao_ecapac_aws_snow', i_name + '_data_avail_list.txt')
-        else:
-            inp_file = os.path.join(ts.basefolder, 'thaao_' + i_name, i_name + '_data_avail_list.txt')
-        i_list.append(i_name)
-    except FileNotFoundError:
-        inp_file = None
+    print(f'{i_idx:02}' + ' ' + i_name)
+    inp_file = os.path.join(avs.avail_folder(i_name), i_name + '_data_avail_list.txt')
+    if file_stat(inp_file) is None:
         print('file for ' + i_name + ' was not found')
+    i_list.append(i_name)
 
     return inp_file, i_list
 
 
-def save_mask_txt(data_val, instr_nm):
+# strftime directives that can appear in filename patterns, with the number of digits they take
+date_directives = {'Y': 4, 'y': 2, 'm': 2, 'd': 2, 'j': 3, 'H': 2, 'M': 2, 'S': 2}
+
+
+def pattern_to_regex(pattern):
+    """
+    Converts a glob-like filename pattern with strftime directives (e.g. 'th%y%m%d.*') to a regular expression
+    with one group per date directive.
+    :param pattern: filename pattern (single path component)
+    :return: compiled regex, string of the directives found (e.g. '%y%m%d')
+    """
+    regex = ''
+    key_fmt = ''
+    idx = 0
+    while idx < len(pattern):
+        c = pattern[idx]
+        if c == '%' and idx + 1 < len(pattern) and pattern[idx + 1] in date_directives:
+            regex += '(\\d{' + str(date_directives[pattern[idx + 1]]) + '})'
+            key_fmt += '%' + pattern[idx + 1]
+            idx += 2
+            continue
+        if c == '*':
+            regex += '.*'
+        elif c == '?':
+            regex += '.'
+        else:
+            regex += re.escape(c)
+        idx += 1
+    flags = re.IGNORECASE if os.name == 'nt' else 0  # glob is case-insensitive on Windows
+    return re.compile(regex + '$', flags), key_fmt
+
+
+def date_key(date, pattern):
+    """
+    Key used by dir_index for a given date: the date formatted with the directives of the pattern only.
+    :param date: datetime
+    :param pattern: filename pattern with strftime directives, as passed to dir_index
+    :return: key string (e.g. '920131' for 'th%y%m%d.*')
+    """
+    return date.strftime(''.join(pattern_to_regex(part)[1] for part in re.split(r'[\\/]', pattern)))
+
+
+def dir_index(folder, pattern):
+    """
+    Lists the folder once and indexes the files matching pattern by the date in their name. Each directory is
+    listed only once, so checking the availability of a day is a dict lookup instead of a glob on the (network)
+    drive. Sub-folders can be part of the pattern (e.g. '%Y/EDT_BGTL_%Y%m%d*').
+    :param folder: instrument folder
+    :param pattern: filename pattern relative to folder, with glob wildcards and strftime directives
+    :return: dict {date_key: [file paths]}
+    """
+    parts = re.split(r'[\\/]', pattern)
+    index = {}
+    to_list = [(folder, 0, '')]
+    while to_list:
+        path, level, key = to_list.pop()
+        regex = pattern_to_regex(parts[level])[0]
+        files, subdirs, _ = list_dir(path, level, stats=False)
+        if level == len(parts) - 1:
+            for fn, size, mtime in files:
+                match = regex.match(os.path.basename(fn))
+                if match:
+                    index.setdefault(key + ''.join(match.groups()), []).append(fn)
+        else:
+            for sub in subdirs:
+                match = regex.match(os.path.basename(sub))
+                if match:
+                    to_list.append((sub, level + 1, key + ''.join(match.groups())))
+    for fns in index.values():
+        fns.sort()
+    return index
+
+
+def file_stat(path, on_drive=False):
+    """
+    Size and mtime of a file, from the catalog when enabled (ts.use_catalog) and covering path.
+    :param path: path of the file (or directory, with size None)
+    :param on_drive: True to stat the drive in any case: the catalog relists a directory only when its own mtime
+    changes, so it misses files modified in place (e.g. archives or weekly files growing)
+    :return: (size, mtime), or None if it does not exist
+    """
+    if ts.use_catalog & (not on_drive):
+        row = cat.stat(path)
+        if row is not None:
+            return row
+        if cat.in_scope(path):
+            return None
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return (None if os.path.isdir(path) else st.st_size), st.st_mtime
+
+
+def list_dir(path, depth, stats=True):
+    """
+    Lists one directory, with size and mtime of its files: from the catalog when enabled (ts.use_catalog) and
+    covering path, otherwise from the drive.
+    :param path: directory
+    :param depth: depth of the directory below the root of the walk
+    :param stats: False to skip the stat of each file when listing the drive (size and mtime are then None)
+    :return: list of (path, size, mtime) of the files, list of sub-directories, depth
+    """
+    if ts.use_catalog:
+        res = cat.listing(path)
+        if res is not None:
+            return res[0], res[1], depth
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir():
+                    subdirs.append(entry.path)
+                elif stats:
+                    st = entry.stat()
+                    files.append((entry.path, st.st_size, st.st_mtime))
+                else:
+                    files.append((entry.path, None, None))
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        pass
+    return files, subdirs, depth
+
+
+def walk_tree(folder, max_depth=None, workers=None, select=None):
+    """
+    Walks a directory tree listing the sub-directories concurrently (at most workers listings at a time), so that
+    on a network drive the latency depends on the number of directories and not on the number of files or days.
+    :param folder: root of the walk
+    :param max_depth: deepest level of sub-directories listed (0: folder only, None: no limit)
+    :param workers: size of the thread pool (None: ts.scan_workers)
+    :param select: function (path, depth) -> bool telling if a sub-directory has to be listed (None: all)
+    :return: generator of (path, size, mtime) of the files, in no particular order
+    """
+    with ThreadPoolExecutor(max_workers=workers or ts.scan_workers) as executor:
+        pending = {executor.submit(list_dir, folder, 0)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs, depth = future.result()
+                yield from files
+                if (max_depth is None) or (depth < max_depth):
+                    pending |= {executor.submit(list_dir, d, depth + 1) for d in subdirs if
+                                (select is None) or select(d, depth + 1)}
+
+
+def tree_index(folder, pattern, entries=None):
+    """
+    Same as dir_index, but matching the pattern against the in-memory listing of a (concurrent) walk.
+    :param folder: instrument folder
+    :param pattern: filename pattern relative to folder, with glob wildcards and strftime directives
+    :param entries: (path, size, mtime) of the files below folder (None: walk_tree down to the depth of the pattern)
+    :return: dict {date_key: [file paths]}
+    """
+    regexes = [pattern_to_regex(part)[0] for part in re.split(r'[\\/]', pattern)]
+    if entries is None:
+        entries = walk_tree(folder, max_depth=len(regexes) - 1)
+    index = {}
+    for path, size, mtime in entries:
+        rel = os.path.relpath(path, folder).split(os.sep)
+        if len(rel) != len(regexes):
+            continue
+        matches = [regex.match(part) for regex, part in zip(regexes, rel)]
+        if all(matches):
+            index.setdefault(''.join(g for match in matches for g in match.groups()), []).append(path)
+    for fns in index.values():
+        fns.sort()
+    return index
+
+
+def zip_members(fn):
+    """
+    :param fn: path of a zip archive
+    :return: list of the names of its members ([] if the archive is unreadable)
+    """
+    try:
+        with zipfile.ZipFile(fn, 'r') as myzip:
+            return myzip.namelist()
+    except (zipfile.BadZipFile, OSError) as e:
+        print(f'cannot read {fn}: {e}')
+        return []
+
+
+def zip_index(instr_nm, fns):
+    """
+    Members of a set of zip archives, from a persistent index (thaao_<instr>/<instr>_zip_index.json) keyed by path,
+    size and mtime: only new or modified archives are opened, in parallel.
+    :param instr_nm: instrument name
+    :param fns: list of paths of the zip archives
+    :return: dict {zip path: [member names]}, list of the archives (re)indexed by this call
+    """
+    fn_index = os.path.join(avs.avail_folder(instr_nm), f'{instr_nm}_zip_index.json')
+    index = {}
+    if not ts.scan_full_rebuild:
+        try:
+            with open(fn_index, 'r') as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass
+
+    stats = {fn: file_stat(fn, on_drive=True) for fn in fns}
+    stale = [fn for fn, st in stats.items() if
+             (index.get(fn, {}).get('size') != st[0]) | (index.get(fn, {}).get('mtime') != st[1])]
+    if stale:
+        print(f'{instr_nm}: indexing {len(stale)} of {len(stats)} archives')
+        with ThreadPoolExecutor(max_workers=ts.scan_workers) as executor:
+            for fn, members in zip(stale, executor.map(zip_members, stale)):
+                index[fn] = {'size': stats[fn][0], 'mtime': stats[fn][1], 'members': members}
+    if stale or (len(index) != len(stats)):
+        index = {fn: index[fn] for fn in stats}
+        with open(fn_index, 'w') as f:
+            json.dump(index, f)
+    return {fn: entry['members'] for fn, entry in index.items()}, stale
+
+
+def member_times(members, pattern):
+    """
+    Dates (or times, if the pattern has %H, %M...) in the names of archive members matching pattern.
+    :param members: list of member names (paths inside the archives)
+    :param pattern: pattern of the member names with glob wildcards and strftime directives (e.g. '%Y-%m-%d/*')
+    :return: DatetimeIndex, sorted and unique
+    """
+    regex, key_fmt = pattern_to_regex(pattern)
+    keys = {''.join(match.groups()) for match in map(regex.match, members) if match}
+    return pd.DatetimeIndex(pd.to_datetime(sorted(keys), format=key_fmt, errors='coerce')).dropna()
+
+
+def nc_times(fn, time_var='time'):
+    """
+    Reads only the time coordinate of a NetCDF file (the data variables are never loaded).
+    :param fn: path of the NetCDF file
+    :param time_var: name of the time variable
+    :return: DatetimeIndex of the valid (non masked) times (empty if the file is unreadable)
+    """
+    if netCDF4 is None:
+        raise ImportError('netCDF4 is needed to read the NetCDF files')
+    try:
+        with netCDF4.Dataset(fn, 'r') as nc:
+            time = nc.variables[time_var]
+            values = np.ma.masked_invalid(time[:]).compressed()
+            times = netCDF4.num2date(values, time.units, calendar=getattr(time, 'calendar', 'standard'),
+                                     only_use_cftime_datetimes=False, only_use_python_datetimes=True)
+    except (OSError, KeyError, AttributeError, ValueError) as e:
+        print(f'cannot read the times of {fn}: {e}')
+        return pd.DatetimeIndex([])
+    return pd.DatetimeIndex(times)
+
+
+def nc_coverage(fns, days, freq, time_var='time'):
+    """
+    Sub-daily coverage of a set of NetCDF files: the time coordinates are read in parallel and counted in bins of
+    freq. Bins without valid times are kept (NaN), so that save_mask_txt writes them as gaps.
+    :param fns: paths of the NetCDF files
+    :param days: days to be covered (the bins span from the first to the end of the last one)
+    :param freq: length of the bins (e.g. '30min')
+    :param time_var: name of the time variable
+    :return: DataFrame indexed by bin start, with the number of valid times in each bin ('n_valid')
+    """
+    if len(days) == 0:
+        return pd.DataFrame({'n_valid': np.array([], dtype=float)}, index=pd.DatetimeIndex([]))
+    with ThreadPoolExecutor(max_workers=ts.scan_workers) as executor:
+        times = list(executor.map(nc_times, fns, [time_var] * len(fns)))
+    times = times[0].append(times[1:]) if times else pd.DatetimeIndex([])
+    bins = pd.date_range(days[0], pd.Timestamp(days[-1]) + pd.Timedelta(days=1), freq=freq, inclusive='left')
+    counts = pd.Series(np.ones(len(times), dtype=int), index=times.floor(freq)).groupby(level=0).size()
+    counts = counts.reindex(bins, fill_value=0)
+    return counts.where(counts > 0).to_frame('n_valid')
+
+
+def scan_state_file(instr_nm):
+    """
+    Path of the json file where the scan state (cursor) of an instrument is persisted.
+    :param instr_nm: instrument name
+    :return: path of the state file, next to the availability list
+    """
+    return os.path.join(avs.avail_folder(instr_nm), f'{instr_nm}_scan_state.json')
+
+
+def load_scan_state(instr_nm):
+    """
+    Reads the scan state saved by the last run of an instrument scanner.
+    :param instr_nm: instrument name
+    :return: dict with 'last_date' (datetime) and 'dir_mtimes' ({dir: mtime}), or None if no (usable) state
+    """
+    try:
+        with open(scan_state_file(instr_nm), 'r') as f:
+            state = json.load(f)
+        return {'last_date' : dt.datetime.fromisoformat(state['last_date']),
+                'dir_mtimes': state.get('dir_mtimes', {})}
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+
+
+def save_scan_state(instr_nm, state):
+    """
+    Persists the scan state of an instrument (to be called once its availability list has been saved).
+    :param instr_nm: instrument name
+    :param state: dict as returned by scan_period
+    :return:
+    """
+    with open(scan_state_file(instr_nm), 'w') as f:
+        json.dump({'last_date' : state['last_date'].isoformat(),
+                   'dir_mtimes': state['dir_mtimes']}, f, indent=1)
+    return
+
+
+def scan_period(instr_nm, date_list, dirs, since=None):
+    """
+    Selects the dates an instrument scanner has to (re)scan, comparing the current state of its directories with the
+    state saved by the last run. Without a saved state, or with ts.scan_full_rebuild, the whole date_list is scanned.
+    Otherwise the scan restarts ts.scan_lookback days before the last scanned date if a directory has changed
+    (or from the first date covered by a changed directory, if known) and only new days are scanned if nothing has.
+    :param instr_nm: instrument name
+    :param date_list: full list of dates of the instrument
+    :param dirs: list of directories holding the data, or dict {directory: first date it covers (or None)}
+    :param since: first date known to have new data (e.g. from watch.py), rescanned even if out of the lookback
+    :return: dates to scan, first date to rewrite in the availability list (None: rewrite all), new scan state
+    """
+    if not isinstance(dirs, dict):
+        dirs = dict.fromkeys(dirs)
+    dir_mtimes = {}
+    for d in dirs:
+        st = file_stat(d)
+        if st is not None:
+            dir_mtimes[d] = st[1]
+    new_state = {'last_date': date_list[-1] if date_list else None, 'dir_mtimes': dir_mtimes}
+
+    state = None if ts.scan_full_rebuild else load_scan_state(instr_nm)
+    if (state is None) | (not date_list):
+        return date_list, None, new_state
+
+    rescan_from = state['last_date'] + dt.timedelta(days=1)
+    for d, mtime in dir_mtimes.items():
+        if state['dir_mtimes'].get(d) != mtime:
+            d_start = dirs[d] if dirs[d] is not None else state['last_date'] - dt.timedelta(days=ts.scan_lookback)
+            rescan_from = min(rescan_from, d_start)
+    if since is not None:
+        rescan_from = min(rescan_from, since)
+    rescan_from = max(rescan_from, date_list[0])
+
+    print(f'{instr_nm}: scanning from {rescan_from:%Y-%m-%d}')
+    return [i for i in date_list if i >= rescan_from], rescan_from, new_state
+
+
+def truncate_avail_list(fn, append_from):
+    """
+    Removes from a (sorted) availability list all the lines from append_from on, reading the file from its end.
+    :param fn: path of the availability list
+    :param append_from: datetime of the first line to remove
+    :return:
+    """
+    key = append_from.strftime('%Y-%m-%d %H:%M:%S').encode()
+    block = 65536
+    with open(fn, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        buf = b''
+        cut = 0
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+            # the first line in buf may be incomplete, unless the beginning of the file has been reached
+            first = 0 if pos == 0 else buf.find(b'\n') + 1
+            if first == 0 and pos > 0:
+                continue
+            found = False
+            line_end = len(buf)
+            while line_end > first:
+                line_start = buf.rfind(b'\n', first, line_end - 1) + 1
+                line_start = max(line_start, first)
+                line = buf[line_start:line_end].strip()
+                if line and line[:19] < key:
+                    cut = pos + line_end
+                    found = True
+                    break
+                line_end = line_start
+            if found:
+                break
+            buf = buf[:first]
+        f.truncate(min(cut, end))
+    return
+
+
+def write_avail_list(fn, out_file, append_from=None):
+    """
+    Writes an availability list, or replaces only its lines from append_from on.
+    :param fn: path of the availability list
+    :param out_file: rows to be written (dt, mask)
+    :param append_from: None to rewrite the whole file, or datetime from which the existing file is replaced
+    :return:
+    """
+    if (append_from is None) | (not os.path.exists(fn)):
+        np.savetxt(fn, out_file, fmt='%s')
+    else:
+        truncate_avail_list(fn, append_from)
+        with open(fn, 'a') as f:
+            np.savetxt(f, out_file, fmt='%s')
+    return
+
+
+def avail_df(dates, mask=None):
+    """
+    Builds the availability frame of an instrument in one go from the dates checked by a scanner and a boolean
+    array telling which of them have data (instead of appending rows one by one with .loc). The frame has the
+    same content of the one built row by row, so save_txt writes exactly the same file.
+    :param dates: list/array of dates (or times)
+    :param mask: boolean array, same length of dates (None: all dates have data)
+    :return: DataFrame with columns ['dt', 'mask'], indexed by the dates with data
+    """
+    if mask is None:
+        sel = pd.Index(dates)
+    else:
+        sel = pd.Index(dates)[np.asarray(mask, dtype=bool)]
+    return pd.DataFrame({'dt': sel, 'mask': np.ones(len(sel), dtype=bool)}, index=sel)
+
+
+def manual_mask(instr_nm, dates):
+    """
+    Days marked as available by hand in ts.manual_avail, as a mask to be or-ed with the scanned one.
+    :param instr_nm: instrument name
+    :param dates: list/array of dates
+    :return: boolean array, same length of dates
+    """
+    dates = pd.DatetimeIndex(dates)
+    mask = np.zeros(len(dates), dtype=bool)
+    for start, end in ts.manual_avail.get(instr_nm, []):
+        mask |= (dates >= start) & (dates <= end)
+    return mask
+
+
+def write_avail_stores(instr_nm, out_file, append_from=None):
+    """
+    Writes the binary availability stores enabled in ts.avail_formats next to the text list.
+    :param instr_nm: instrument name
+    :param out_file: rows of the availability list (dt, mask)
+    :param append_from: None to rewrite the stores, or datetime from which they are replaced
+    :return:
+    """
+    out_file = pd.DataFrame(out_file)
+    if 'bitset' in ts.avail_formats:
+        avs.save_bitset(avs.avail_file(instr_nm, 'bits'), out_file.iloc[:, 0], out_file.iloc[:, 1], append_from)
+    fn_intervals = avs.avail_file(instr_nm, 'txt').replace('.txt', '_intervals.txt')
+    if ('intervals' in ts.avail_formats) | ('pyramid' in ts.avail_formats):
+        avs.save_intervals(
+                fn_intervals, out_file.iloc[:, 0], out_file.iloc[:, 1], avs.interval_max_gap(instr_nm), append_from)
+    if 'pyramid' in ts.avail_formats:
+        # built from the whole (updated) interval list, which is cheap to read
+        avs.save_pyramid(
+                avs.avail_file(instr_nm, 'txt').replace('.txt', '_pyramid.npz'), avs.read_intervals(fn_intervals),
+                avs.sample_cadence(avs.to_times_mask(out_file.iloc[:, 0], out_file.iloc[:, 1])[0],
+                                   avs.interval_max_gap(instr_nm)))
+    if 'parquet' in ts.avail_formats:
+        avs.save_parquet(avs.avail_file(instr_nm, 'parquet'), out_file.iloc[:, 0], out_file.iloc[:, 1], append_from)
+    return
+
+
+def save_mask_txt(data_val, instr_nm, append_from=None):
     """
 
     :param data_val:
     :param instr_nm:
+    :param append_from: if given, only data from this datetime on are written, replacing the tail of the existing list
     :return:
     """
-    fol_out = os.path.join(ts.basefolder, "thaao_" + instr_nm)
+    fol_out = avs.avail_folder(instr_nm)
+
+    if append_from is not None:
+        data_val = data_val[data_val.index >= append_from]
 
     # Make sure interesting data fields are numeric (i.e. floats)
     data_val = data_val.apply(pd.to_numeric, errors='coerce')
@@ -82,21 +541,24 @@ def save_mask_txt(data_val, instr_nm):
     out_file = pd.concat([pd.Series(data_val.index.values), pd.Series(valid_mask.values)], axis=1)
 
     print(f'Saving: {instr_nm}')
-    np.savetxt(os.path.join(fol_out, f'{instr_nm}_data_avail_list.txt'), out_file, fmt='%s')
+    write_avail_list(os.path.join(fol_out, f'{instr_nm}_data_avail_list.txt'), out_file, append_from)
+    write_avail_stores(instr_nm, out_file, append_from)
     print('Saved ' + os.path.join(fol_out, f'{instr_nm}_data_avail_list.txt'))
     return
 
 
-def save_txt(instr_nm, data_val):
+def save_txt(instr_nm, data_val, append_from=None):
     """
 
     :param data_val:
     :param instr_nm:
+    :param append_from: if given, the existing list is kept up to this datetime and data_val is appended after it
     :return:
     """
-    fol_out = os.path.join(ts.basefolder, f'thaao_{instr_nm}')
+    fol_out = avs.avail_folder(instr_nm)
 
     print('Saving: ' + instr_nm)
-    np.savetxt(os.path.join(fol_out, f'{instr_nm}_data_avail_list.txt'), data_val, fmt='%s')
+    write_avail_list(os.path.join(fol_out, f'{instr_nm}_data_avail_list.txt'), data_val, append_from)
+    write_avail_stores(instr_nm, data_val, append_from)
     print('Saved ' + str(os.path.join(fol_out, instr_nm + '_data_avail_list.txt')))
     return
@@ -23,10 +23,10 @@ __lastupdate__ = "October 2024"
 
 import os
 
-import numpy as np
 import pandas as pd
 
 import thaao_settings as ts
+import tools as tls
 
 instr = 'wv_isotopes'
 folder = os.path.join(ts.basefolder, "thaao_" + instr)
@@ -34,8 +34,7 @@ folder = os.path.join(ts.basefolder, "thaao_" + instr)
 if __name__ == "__main__":
     fn = os.path.join(folder, 'wv_isotopes.xlsx')
     wv_isotopes_tmp = pd.read_excel(fn)
-    vals = np.repeat(True, len(wv_isotopes_tmp))
 
-    wv_isotopes = pd.concat([pd.Series(wv_isotopes_tmp.values[:, 0]), pd.Series(vals)], axis=1)
+    wv_isotopes = tls.avail_df(wv_isotopes_tmp.values[:, 0])
 
-    ts.save_mask_txt(wv_isotopes, instr)
+    tls.save_txt(instr, wv_isotopes)
@@ -26,12 +26,13 @@ import os
 import pandas as pd
 
 import thaao_settings as ts
+import tools as tls
 
 instr = 'vespa'
 folder = os.path.join(ts.basefolder, "thaao_" + instr)
 if __name__ == "__main__":
-    vespa = pd.read_table(os.path.join(folder, 'vespaIWV_July2016-Sept2022_v3.txt'), delimiter='\s+')
+    vespa = pd.read_table(os.path.join(folder, 'vespaIWV_July2016-Sept2022_v3.txt'), sep=r'\s+')
     vespa['dt'] = vespa['yyyy-mm-dd'].values + ' ' + vespa['HH:MM:SS'].values
     vespa.index = pd.DatetimeIndex(vespa['dt'])
 
-    ts.save_mask_txt(vespa['PWV'], instr)
+    tls.save_mask_txt(vespa[['PWV']], instr)
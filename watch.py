@@ -0,0 +1,294 @@
+#!/usr/local/bin/python3
+# -*- coding: utf-8 -*-
+# -------------------------------------------------------------------------------
+#
+"""
+Watches the instrument folders and updates the availability of an instrument as soon as new files arrive.
+"""
+
+# =============================================================
+# CREATED:
+# AFFILIATION: INGV
+# AUTHORS: Filippo Cali' Quaglia
+# =============================================================
+#
+# -------------------------------------------------------------------------------
+__author__ = "Filippo Cali' Quaglia"
+__credits__ = ["??????"]
+__license__ = "GPL"
+__version__ = "0.1"
+__email__ = "filippo.caliquaglia@ingv.it"
+__status__ = "Research"
+__lastupdate__ = "October 2024"
+
+import argparse
+import ctypes
+import ctypes.util
+import datetime as dt
+import os
+import re
+import select
+import struct
+import sys
+import time
+
+import catalog as cat
+import scan_all as sa
+import scan_engine as se
+import thaao_settings as ts
+import tools as tls
+
+# inotify events: file written and closed, file moved in, file/directory created
+in_close_write = 0x008
+in_moved_to = 0x080
+in_create = 0x100
+in_isdir = 0x40000000
+event_header = struct.Struct('iIII')
+# file systems where inotify does not see the files written by other machines
+network_fs = ('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'afs', '9p', 'ceph', 'glusterfs', 'lustre', 'davfs', 'fuse')
+
+
+class InotifyWatcher:
+    """
+    Changed files from the Linux inotify API (through libc), on all the directories below the watched folders.
+    """
+
+    def __init__(self, folders):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.dirs = {}
+        for fol in folders:
+            self.add_tree(fol)
+
+    def add_tree(self, folder):
+        """
+        :param folder: directory to be watched, with all its sub-directories
+        :return:
+        """
+        for path, _, _ in os.walk(folder):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), in_close_write | in_moved_to | in_create)
+            if wd >= 0:
+                self.dirs[wd] = path
+        return
+
+    def changes(self, timeout):
+        """
+        :param timeout: seconds to wait for events
+        :return: list of paths of the files written or moved in (new directories are watched too)
+        """
+        paths = []
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return paths
+        buf = os.read(self.fd, 1 << 16)
+        pos = 0
+        while pos < len(buf):
+            wd, mask, cookie, length = event_header.unpack_from(buf, pos)
+            name = buf[pos + event_header.size:pos + event_header.size + length].rstrip(b'\0')
+            pos += event_header.size + length
+            if wd not in self.dirs:
+                continue
+            path = os.path.join(self.dirs[wd], os.fsdecode(name))
+            if mask & in_isdir:
+                self.add_tree(path)
+                paths.extend(os.path.join(p, f) for p, _, fs in os.walk(path) for f in fs)
+            elif mask & (in_close_write | in_moved_to):
+                paths.append(path)
+        return paths
+
+
+class PollWatcher:
+    """
+    Changed files from periodic listings of the watched folders (from the catalog, if enabled), compared with the
+    previous one: works on network mounts, where inotify does not see the changes made by other machines.
+    """
+
+    def __init__(self, folders):
+        self.folders = folders
+        self.snapshot = self.listing()
+        self.next_poll = time.time() + ts.watch_poll
+
+    def listing(self):
+        """
+        :return: dict {path: (size, mtime)} of all the files below the watched folders
+        """
+        if ts.use_catalog:
+            cat.refresh()
+        return {path: (size, mtime) for fol in self.folders for path, size, mtime in tls.walk_tree(fol)}
+
+    def changes(self, timeout):
+        """
+        :param timeout: seconds to wait at most
+        :return: list of paths of the files new or changed since the previous poll
+        """
+        wait = self.next_poll - time.time()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(wait, 0))
+        self.next_poll = time.time() + ts.watch_poll
+        current = self.listing()
+        paths = [path for path, st in current.items() if self.snapshot.get(path) != st]
+        self.snapshot = current
+        return paths
+
+
+def instr_regexes():
+    """
+    :return: dict {instrument: (folder, list of (compiled regex, date directives), one per component of its
+    pattern)} for the instruments of ts.instr_registry with files
+    """
+    return {instr_nm: (se.instr_folder(instr_nm),
+                       [tls.pattern_to_regex(part) for part in re.split(r'[\\/]', cfg['pattern'])]) for
+            instr_nm, cfg in ts.instr_registry.items() if 'pattern' in cfg}
+
+
+def match_file(path, regexes):
+    """
+    Instrument and day of a file.
+    :param path: path of the file
+    :param regexes: as returned by instr_regexes
+    :return: (instrument, date in the file name) of the first instrument whose pattern matches, or None (also if the
+    date is not valid)
+    """
+    for instr_nm, (fol, parts) in regexes.items():
+        if not path.startswith(fol + os.sep):
+            continue
+        rel = os.path.relpath(path, fol).split(os.sep)
+        if len(rel) != len(parts):
+            continue
+        matches = [regex.match(part) for (regex, key_fmt), part in zip(parts, rel)]
+        if all(matches):
+            # the date is read from the file name, as in scan_engine.scan_dirs
+            try:
+                return instr_nm, dt.datetime.strptime(''.join(matches[-1].groups()), parts[-1][1])
+            except ValueError:  # digits in the right place, but not a date (e.g. th991399.dat)
+                print(f'{path}: no valid date in the name, skipped')
+                return None
+    return None
+
+
+def match_script(path):
+    """
+    :param path: path of the file
+    :return: script updating the folder of the file (ts.watch_scripts), or None
+    """
+    for fol, script in ts.watch_scripts.items():
+        if path.startswith(os.path.join(ts.basefolder, fol) + os.sep):
+            return script
+    return None
+
+
+def update(paths, regexes, refresh=True):
+    """
+    Updates the outputs of the instruments the changed files belong to. Registry instruments are rescanned by the
+    incremental scan of scan_engine (the days after the last scan and the lookback of the changed folders, back to
+    the oldest day of the changed files), the others by their script.
+    :param paths: paths of the new or changed files
+    :param regexes: as returned by instr_regexes
+    :param refresh: refresh the catalog first (not needed after a poll, which has just refreshed it)
+    :return:
+    """
+    days = {}
+    scripts = set()
+    for path in paths:
+        match = match_file(path, regexes)
+        if match is not None:
+            days.setdefault(match[0], set()).add(match[1])
+        elif match_script(path) is not None:
+            scripts.add(match_script(path))
+    if days and refresh and ts.use_catalog:
+        cat.refresh()
+    for instr_nm, keys in days.items():
+        print(f'{instr_nm}: new data for ' + ', '.join(f'{i:%Y-%m-%d}' for i in sorted(keys)))
+        fol, parts = regexes[instr_nm]
+        try:
+            se.scan_instrument(instr_nm, list(tls.walk_tree(fol, max_depth=len(parts) - 1)), since=min(keys))
+        except Exception as e:  # the watch goes on
+            print(f'{instr_nm}: FAILED ({e})')
+    for script in scripts:
+        script, ret, elapsed, err = sa.run_script(script, ts.scan_timeout)
+        print(f'{script}: ' + ('done' if ret == 0 else f'FAILED ({ret})') + f' in {elapsed}')
+    return
+
+
+def fs_type(path):
+    """
+    File system of a path, from the mount point holding it in /proc/mounts (Linux).
+    :param path: path
+    :return: file system type (e.g. 'ext4', 'nfs4', 'cifs', 'fuse.sshfs'), None if unknown
+    """
+    try:
+        with open('/proc/mounts', 'r') as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best = ('', None)
+    for mount, fs in mounts:
+        mount = mount.replace('\\040', ' ').replace('\\011', '\t').replace('\\134', '\\')
+        if ((path == mount) | path.startswith(mount.rstrip('/') + '/')) & (len(mount) > len(best[0])):
+            best = (mount, fs)
+    return best[1]
+
+
+def new_watcher(folders):
+    """
+    :param folders: folders to be watched
+    :return: InotifyWatcher (ts.watch_mode 'inotify', or 'auto' on Linux with all the folders on local disks) or
+    PollWatcher
+    """
+    if (ts.watch_mode == 'auto') & sys.platform.startswith('linux'):
+        remote = {fs for fs in map(fs_type, folders) if (fs is not None) and fs.split('.')[0] in network_fs}
+        if remote:
+            print(f'folders on a network mount ({", ".join(sorted(remote))}): polling every {ts.watch_poll} s')
+            return PollWatcher(folders)
+    if (ts.watch_mode == 'inotify') | ((ts.watch_mode == 'auto') & sys.platform.startswith('linux')):
+        try:
+            return InotifyWatcher(folders)
+        except (OSError, AttributeError) as e:  # no inotify in libc, or too many watches
+            print(f'inotify not available ({e}): polling every {ts.watch_poll} s')
+    return PollWatcher(folders)
+
+
+def watch():
+    """
+    Runs until interrupted: changed files are collected until ts.watch_debounce seconds pass without new ones,
+    then the outputs of their instruments are updated. The scripts in ts.watch_periodic run at their period.
+    :return:
+    """
+    regexes = instr_regexes()
+    folders = [fol for fol, _ in regexes.values()] + [os.path.join(ts.basefolder, fol) for fol in ts.watch_scripts]
+    folders = [fol for fol in dict.fromkeys(folders) if os.path.isdir(fol)]
+    watcher = new_watcher(folders)
+    print(f'watching {len(folders)} folders with {type(watcher).__name__}')
+
+    next_run = {script: time.time() for script in ts.watch_periodic}
+    pending = set()
+    last_event = time.time()
+    while True:
+        paths = watcher.changes(1)
+        if paths:
+            pending.update(paths)
+            last_event = time.time()
+        elif pending and (time.time() - last_event >= ts.watch_debounce):
+            update(sorted(pending), regexes, refresh=not isinstance(watcher, PollWatcher))
+            pending = set()
+        for script, due in next_run.items():
+            if time.time() >= due:
+                script, ret, elapsed, err = sa.run_script(script, ts.scan_timeout)
+                print(f'{script}: ' + ('done' if ret == 0 else f'FAILED ({ret})') + f' in {elapsed}')
+                next_run[script] = time.time() + ts.watch_periodic[script]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Update the availability lists as soon as new data arrive.')
+    parser.add_argument('--poll', action='store_true', help='poll the folders instead of using inotify')
+    args = parser.parse_args()
+    if args.poll:
+        ts.watch_mode = 'poll'
+    try:
+        watch()
+    except KeyboardInterrupt:
+        pass